@@ -0,0 +1,392 @@
+"""Offline benchmarks for codeql-summarize.
+
+Runs each stage against the stub CodeQL CLI in this folder and records
+its wall time, peak Python memory and the memory its result keeps. Results
+are written as JSON so runs on different commits can be compared, failing
+if a case uses more memory than before:
+
+    python -m benchmarks --output before.json
+    python -m benchmarks --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+from statistics import median
+from typing import *
+from argparse import ArgumentParser
+
+sys.path.append(".")
+
+from benchmarks.fixtures import (
+    STUB_CLI,
+    DatabaseServer,
+    createArchive,
+    createDatabase,
+    resetState,
+    syntheticRows,
+)
+from codeqlsummarize import utils
+from codeqlsummarize.generator import Generator
+from codeqlsummarize.exporters import EXPORTERS, FINALIZERS
+from codeqlsummarize.models import CodeQLDatabase, GitHub, Summaries
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+parser = ArgumentParser("benchmarks", "codeql-summarize benchmarks")
+parser.add_argument("--rows", type=int, default=10000, help="Rows per query result")
+parser.add_argument(
+    "--databases", type=int, default=4, help="Databases in the end-to-end run"
+)
+parser.add_argument(
+    "--jobs", type=int, default=2, help="Analysis concurrency of the end-to-end run"
+)
+parser.add_argument(
+    "--latency",
+    type=float,
+    default=0.0,
+    help="Seconds each stub `database run-queries` takes",
+)
+parser.add_argument(
+    "--compile",
+    type=float,
+    default=0.0,
+    help="Seconds the stub CLI takes to compile a query (without a cached one)",
+)
+parser.add_argument(
+    "--log-lines",
+    type=int,
+    default=0,
+    help="Evaluator log lines each stub `database run-queries` prints",
+)
+parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+parser.add_argument("--cases", help="Comma separated cases to run (default: all)")
+parser.add_argument("--output", help="Write the results to this JSON file")
+parser.add_argument("--compare", help="Compare against a previous results file")
+parser.add_argument(
+    "--max-memory-regression",
+    type=float,
+    default=1.25,
+    help="Fail the comparison if a case's memory grew by more than this ratio",
+)
+parser.add_argument("--debug", action="store_true")
+
+
+class Case:
+    """A benchmark case.
+
+    `setup` runs once (untimed) and returns the function being measured.
+    Resources it needs until the case is done are added to the exit stack.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        setup: Callable[[str, contextlib.ExitStack], Callable[[], Any]],
+    ):
+        self.name = name
+        self.setup = setup
+
+
+def syntheticDatabase(name: str, rows: int) -> CodeQLDatabase:
+    database = CodeQLDatabase(name, "java", repository=f"bench/{name}")
+    database.summaries = {
+        model: Summaries(syntheticRows(rows, model))
+        for model in ["SinkModel", "SourceModel"]
+    }
+    return database
+
+
+def decodeCase(page_size: Optional[int] = None, store: bool = False):
+    def setup(temp: str, stack: contextlib.ExitStack):
+        database = CodeQLDatabase(
+            "decode", "java", path=createDatabase(os.path.join(temp, "decode"))
+        )
+        Generator.TEMP_PATH = temp
+        generator = Generator(database)
+
+        query = generator.getModelGeneratorQuery("SinkModel")
+        utils.findCodeQLCli()("database", "run-queries", database.path, query)
+        bqrs = generator.resultPath(query)
+
+        def run():
+            Generator.PAGE_SIZE = page_size
+            if store:
+                return Summaries(generator.readRows(bqrs))
+            return sum(1 for _ in generator.readRows(bqrs))
+
+        return run
+
+    return setup
+
+
+def sortCase(arguments):
+    def setup(temp: str, stack: contextlib.ExitStack):
+        rows = syntheticRows(arguments.rows)
+        return lambda: Summaries(rows)
+
+    return setup
+
+
+def exportCase(arguments, format: str):
+    def setup(temp: str, stack: contextlib.ExitStack):
+        github = GitHub(owner="bench", token="bench")
+        databases = [syntheticDatabase(f"repo{i}", arguments.rows) for i in range(2)]
+
+        output = os.path.join(temp, "output")
+        os.makedirs(output)
+        if format == "extensions":
+            with open(os.path.join(output, "qlpack.yml"), "w") as handle:
+                handle.write("extensionTargets:\n  codeql/java-queries: '*'\n")
+        elif format == "bundle":
+            pack = os.path.join(output, "java-summarize")
+            os.makedirs(pack)
+            open(os.path.join(pack, "qlpack.yml"), "w").close()
+        elif format == "customizations":
+            output = os.path.join(output, "Customizations.qll")
+        elif format == "json":
+            output = os.path.join(output, "summaries.json")
+        elif format == "json-lines":
+            output = os.path.join(output, "summaries.jsonl")
+
+        exporter = EXPORTERS[format]
+        finalizer = FINALIZERS.get(format)
+
+        def run():
+            for database in databases:
+                exporter(database, output, github=github)
+            if finalizer:
+                finalizer(databases, output, github=github)
+
+        return run
+
+    return setup
+
+
+def endToEndCase(arguments, cached: bool = False):
+    def setup(temp: str, stack: contextlib.ExitStack):
+        from codeqlsummarize.__main__ import parser as main_parser, main
+
+        projects = os.path.join(temp, "projects.json")
+        with open(projects, "w") as handle:
+            json.dump(
+                {"java": [f"bench/repo{i}" for i in range(arguments.databases)]},
+                handle,
+            )
+        options = [
+            "--disable-banner",
+            "-i",
+            projects,
+            "-f",
+            "json-lines",
+            "-o",
+            os.path.join(temp, "summaries.jsonl"),
+            "-t",
+            "bench",
+            "-j",
+            str(arguments.jobs),
+        ]
+        server = stack.enter_context(DatabaseServer(createArchive()))
+        stack.callback(utils.HTTP_CLIENT.close)
+        stack.callback(setattr, GitHub, "endpoint", GitHub.endpoint)
+        GitHub.endpoint = server.endpoint
+
+        def run():
+            runner_temp = os.path.join(temp, "runner")
+            if not cached:
+                shutil.rmtree(runner_temp, ignore_errors=True)
+            resetState()
+            os.environ["RUNNER_TEMP"] = runner_temp
+            main(main_parser.parse_args(options))
+
+        if cached:
+            # Populate the database and result caches
+            run()
+
+        return run
+
+    return setup
+
+
+def createCases(arguments) -> List[Case]:
+    cases = [
+        Case("decode", decodeCase()),
+        Case("decode-paged", decodeCase(max(arguments.rows // 4, 1))),
+        Case("decode-store", decodeCase(store=True)),
+        Case("sort", sortCase(arguments)),
+    ]
+    for format in EXPORTERS:
+        cases.append(Case(f"export-{format}", exportCase(arguments, format)))
+    cases.append(Case("end-to-end", endToEndCase(arguments)))
+    cases.append(Case("end-to-end-cached", endToEndCase(arguments, cached=True)))
+    return cases
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as temp, contextlib.ExitStack() as stack:
+        resetState()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            func = case.setup(temp, stack)
+
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                runs.append(time.perf_counter() - started)
+
+            # Tracing slows the case down, so memory is measured separately
+            tracemalloc.start()
+            try:
+                # Kept alive while measuring what it retains
+                result = func()
+                retained, peak = tracemalloc.get_traced_memory()
+                del result
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "seconds": min(runs),
+        "median": median(runs),
+        "runs": runs,
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+    }
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=BENCHMARKS,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Memory growth below this is noise (e.g. a cache warming up)
+MEMORY_SLACK = 1024 * 1024
+
+
+def compare(
+    results: Dict[str, dict], baseline_path: str, max_regression: float
+) -> List[str]:
+    """Print the changes since the baseline, returning the cases whose
+    memory regressed"""
+    with open(baseline_path, "r") as handle:
+        baseline = json.load(handle).get("results", {})
+
+    regressions = []
+    print(
+        f"\n{'Case':<24} {'Baseline':>10} {'Current':>10} {'Time':>8} "
+        f"{'Memory':>8} {'Retained':>9}"
+    )
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"{name:<24} {'-':>10} {result['seconds']:>9.3f}s")
+            continue
+        time_ratio = result["seconds"] / max(previous["seconds"], 1e-9)
+
+        ratios = []
+        for metric in ["peak_bytes", "retained_bytes"]:
+            if metric not in previous:
+                # Baselines from before the metric was recorded
+                ratios.append(None)
+                continue
+            ratio = result[metric] / max(previous[metric], 1)
+            ratios.append(ratio)
+            if (
+                ratio > max_regression
+                and result[metric] - previous[metric] > MEMORY_SLACK
+            ):
+                regressions.append(f"{name} {metric}")
+
+        memory, retained = [
+            f"{r:>7.2f}x" if r is not None else f"{'-':>8}" for r in ratios
+        ]
+        print(
+            f"{name:<24} {previous['seconds']:>9.3f}s {result['seconds']:>9.3f}s "
+            f"{time_ratio:>7.2f}x {memory} {retained:>9}"
+        )
+    return regressions
+
+
+def main(arguments):
+    logging.basicConfig(
+        level=logging.DEBUG if arguments.debug else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    # The stub CLI is found on the PATH like a real CodeQL install
+    os.environ["PATH"] = (
+        os.path.dirname(STUB_CLI) + os.pathsep + os.environ.get("PATH", "")
+    )
+    os.environ["CODEQL_BENCH_ROWS"] = str(arguments.rows)
+    os.environ["CODEQL_BENCH_LATENCY"] = str(arguments.latency)
+    os.environ["CODEQL_BENCH_COMPILE"] = str(arguments.compile)
+    os.environ["CODEQL_BENCH_LOG"] = str(arguments.log_lines)
+
+    cases = createCases(arguments)
+    if arguments.cases:
+        selected = arguments.cases.split(",")
+        cases = [case for case in cases if case.name in selected]
+
+    results = {}
+    print(
+        f"{'Case':<24} {'Time':>10} {'Median':>10} {'Peak memory':>14} {'Retained':>12}"
+    )
+    for case in cases:
+        results[case.name] = measure(case, arguments.repeat)
+        result = results[case.name]
+        print(
+            f"{case.name:<24} {result['seconds']:>9.3f}s {result['median']:>9.3f}s "
+            f"{result['peak_bytes'] / 1048576:>11.1f} MiB "
+            f"{result['retained_bytes'] / 1048576:>8.1f} MiB"
+        )
+
+    regressions = []
+    if arguments.compare:
+        regressions = compare(
+            results, arguments.compare, arguments.max_memory_regression
+        )
+
+    if arguments.output:
+        report = {
+            "commit": commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "rows": arguments.rows,
+                "databases": arguments.databases,
+                "jobs": arguments.jobs,
+                "latency": arguments.latency,
+                "compile": arguments.compile,
+                "log_lines": arguments.log_lines,
+                "repeat": arguments.repeat,
+            },
+            "results": results,
+        }
+        with open(arguments.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+
+    if regressions:
+        print(f"\nMemory regressed (over {arguments.max_memory_regression}x):")
+        for regression in regressions:
+            print(f" - {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
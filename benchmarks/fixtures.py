@@ -0,0 +1,127 @@
+"""Synthetic inputs for the benchmarks"""
+
+import io
+import os
+import random
+import zipfile
+import threading
+from typing import *
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stub CodeQL CLI used by the benchmarks and the tests
+STUB_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codeql")
+
+KINDS = {
+    "SinkModel": ["sql", "xss", "command-injection", "path-injection"],
+    "SourceModel": ["remote", "local"],
+    "SummaryModel": ["taint", "value"],
+}
+
+
+def syntheticRows(count: int, model: str = "SinkModel", seed: int = 0) -> List[str]:
+    """Model rows shaped like the model generator output.
+
+    Packages and types repeat (as they do in real results) so interning and
+    sorting see realistic data. The same seed always gives the same rows.
+    """
+    rand = random.Random(f"{model}-{seed}")
+    kinds = KINDS.get(model, ["sql"])
+    packages = [f"com.example.pkg{i}" for i in range(max(count // 200, 1))]
+
+    rows = []
+    for i in range(count):
+        package = rand.choice(packages)
+        rows.append(
+            ";".join(
+                [
+                    package,
+                    f"Type{rand.randrange(max(count // 20, 1))}",
+                    rand.choice(["true", "false"]),
+                    f"method{i}",
+                    "(String,int)",
+                    "",
+                    f"Argument[{rand.randrange(3)}]",
+                    rand.choice(kinds),
+                    "generated",
+                ]
+            )
+        )
+    return rows
+
+
+def resetState():
+    """Forget what the previous run discovered, as a new process would"""
+    # The stub CLI imports these fixtures without the package on its path
+    from codeqlsummarize import utils
+    from codeqlsummarize.generator import Generator
+    from codeqlsummarize.trace import TRACER
+
+    utils._codeql_cli = None
+    Generator._packs = {}
+    Generator._cli_version = None
+    Generator.CACHE = None
+    Generator.PAGE_SIZE = None
+    Generator.SCHEDULER = None
+    Generator.COMPILATION_CACHE = None
+    Generator.QUERY_TIMEOUT = None
+    Generator.DATABASE_TIMEOUT = None
+    TRACER.reset()
+    utils.RESOURCES.usages.clear()
+
+
+def createDatabase(path: str, language: str = "java") -> str:
+    """Create a minimal (unfinalized) CodeQL database directory"""
+    os.makedirs(os.path.join(path, f"db-{language}"), exist_ok=True)
+    with open(os.path.join(path, "codeql-database.yml"), "w") as handle:
+        handle.write(f"primaryLanguage: {language}\nname: {os.path.basename(path)}\n")
+    return path
+
+
+def createArchive(language: str = "java", size: int = 1024 * 1024) -> bytes:
+    """A database archive as returned by the Code Scanning API"""
+    data = io.BytesIO()
+    rand = random.Random(size)
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{language}/codeql-database.yml", f"primaryLanguage: {language}\n")
+        zf.writestr(f"{language}/src.zip", rand.randbytes(size // 4))
+        for i in range(8):
+            zf.writestr(
+                f"{language}/db-{language}/default/pool/{i}/data",
+                rand.randbytes(size // 16) * 2,
+            )
+    return data.getvalue()
+
+
+class _DatabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.archive
+        self.send_response(200)
+        self.send_header("ETag", f'"{len(body)}"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DatabaseServer:
+    """Local stand-in for the Code Scanning databases API"""
+
+    def __init__(self, archive: bytes):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _DatabaseHandler)
+        self.server.archive = archive
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
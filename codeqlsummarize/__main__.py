@@ -3,16 +3,33 @@ import sys
 import json
 import logging
 import tempfile
+import threading
+from typing import *
 from argparse import ArgumentParser
+from subprocess import TimeoutExpired
 
 sys.path.append(".")
 
 from codeqlsummarize import __MODULE_PATH__, DOCUMENTATION
 from codeqlsummarize.__version__ import __banner__
+from codeqlsummarize.cache import DatabaseCache, ResultCache
 from codeqlsummarize.generator import Generator, QUERIES
-from codeqlsummarize.models import CodeQLDatabase, GitHub
-from codeqlsummarize.exporters import EXPORTERS
-from codeqlsummarize.utils import detectLanguage
+from codeqlsummarize.journal import Journal
+from codeqlsummarize.models import EXTRACTION_STAMP, CodeQLDatabase, GitHub, loadStamp
+from codeqlsummarize.exporters import EXPORTERS, FINALIZERS
+from codeqlsummarize.pipeline import Pipeline, Stage
+from codeqlsummarize.scheduler import Scheduler
+from codeqlsummarize.shard import loadSizes, selectShard
+from codeqlsummarize.trace import TRACER, count, span
+from codeqlsummarize import utils
+from codeqlsummarize.utils import (
+    RESOURCES,
+    CodeQLServer,
+    detectLanguage,
+    loadMetadata,
+    parseDuration,
+    parseSize,
+)
 
 logger = logging.getLogger("main")
 
@@ -25,17 +42,146 @@ parser.add_argument(
     "-f",
     "--format",
     default="extensions",
-    help="Export format (`json`, `customizations`, `extensions`, `bundle`)",
+    help="Export format (`json`, `json-lines`, `customizations`, `extensions`, `bundle`)",
 )
 parser.add_argument("-i", "--input", help="Input / Project File")
 parser.add_argument(
     "-o", "--output", default=os.getcwd(), help="Output directory / file"
 )
 parser.add_argument("--disable-banner", action="store_true", help="Disable Banner")
-parser.add_argument("--disable-cache", action="store_true", help="Disable Caching Databases and other files")
+parser.add_argument(
+    "--disable-cache",
+    action="store_true",
+    help="Disable Caching Databases and other files",
+)
+parser.add_argument(
+    "--cache-max-bytes",
+    help="Disk budget for cached databases, e.g. `50G` (evicts least recently used)",
+)
+parser.add_argument(
+    "--cache-dir", help="Query result cache directory (default: <temp>/results)"
+)
+parser.add_argument(
+    "--disable-result-cache",
+    action="store_true",
+    help="Disable caching of decoded query results",
+)
+parser.add_argument(
+    "--clear-result-cache",
+    action="store_true",
+    help="Remove all cached query results before running",
+)
+parser.add_argument(
+    "--shard",
+    help="Only process the `i/n` (e.g. `1/4`) slice of the databases, for running across multiple nodes",
+)
+parser.add_argument(
+    "--shard-sizes",
+    help="JSON file of known database sizes (repository to bytes) used to balance the shards",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Resume the last run if it didn't complete, skipping the work it finished",
+)
+parser.add_argument(
+    "--journal", help="Run journal used by `--resume` (default: <temp>/journal.jsonl)"
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    "--analysis-concurrency",
+    dest="jobs",
+    type=int,
+    default=1,
+    help="Number of databases to analyze concurrently (default: 1)",
+)
+parser.add_argument(
+    "--extract-threads",
+    type=int,
+    default=1,
+    help="Number of threads used to decompress a database archive (default: 1)",
+)
+parser.add_argument(
+    "--extract-minimal",
+    action="store_true",
+    help="Only extract the parts of a database the queries need",
+)
+parser.add_argument(
+    "--disable-batch-queries",
+    action="store_true",
+    help="Run each model generator query in its own `codeql` invocation",
+)
+parser.add_argument(
+    "--bqrs-page-size",
+    type=int,
+    help="Decode query results in pages of this many rows",
+)
+parser.add_argument(
+    "--trace-file",
+    help="Write the timings of each stage as a Chrome trace (`chrome://tracing`)",
+)
+parser.add_argument(
+    "--resource-report",
+    help="Write the CPU time, peak memory and wall time of each `codeql` invocation as JSON",
+)
+parser.add_argument(
+    "--download-concurrency",
+    type=int,
+    default=2,
+    help="Number of databases to download concurrently (default: 2)",
+)
+parser.add_argument(
+    "--extract-concurrency",
+    type=int,
+    default=1,
+    help="Number of database archives to extract concurrently (default: 1)",
+)
 
 parser_codeql = parser.add_argument_group("CodeQL")
 parser_codeql.add_argument("--codeql-base", default="./codeql", help="CodeQL Base Path")
+parser_codeql.add_argument(
+    "--max-threads",
+    type=int,
+    help="Cores shared by concurrent query evaluations (default: all available)",
+)
+parser_codeql.add_argument(
+    "--max-ram",
+    help="Memory shared by concurrent query evaluations, e.g. `48G` (default: 80%% of available)",
+)
+parser_codeql.add_argument(
+    "--compilation-cache",
+    help="Compiled query cache shared by all evaluations and runs (default: <temp>/compilation-cache)",
+)
+parser_codeql.add_argument(
+    "--disable-compilation-cache",
+    action="store_true",
+    help="Use the CodeQL CLI's own compilation cache",
+)
+parser_codeql.add_argument(
+    "--precompile",
+    action="store_true",
+    help="Compile the model generator queries once, before analyzing any database",
+)
+parser_codeql.add_argument(
+    "--query-timeout",
+    help="Wall-clock budget of each query evaluation, e.g. `30m` (default: unlimited)",
+)
+parser_codeql.add_argument(
+    "--database-timeout",
+    help="Wall-clock budget of all the query evaluations of a database, e.g. `2h` (default: unlimited)",
+)
+parser_codeql.add_argument(
+    "--cli-cache-ttl",
+    type=int,
+    default=0,
+    help="Cache the discovered CodeQL CLI on disk for this many seconds",
+)
+parser_codeql.add_argument(
+    "--cli-server",
+    action="store_true",
+    help="Run CodeQL commands through a long-lived `codeql execute cli-server`",
+)
 parser_codeql.add_argument("-p", "--project-repo", help="Project Repo")
 parser_codeql.add_argument("-db", "--database", help="CodeQL Database Location")
 parser_codeql.add_argument("-l", "--language", help="CodeQL Database Language")
@@ -78,6 +224,39 @@ def main(arguments):
     )
     os.makedirs(temppath, exist_ok=True)
     Generator.TEMP_PATH = temppath
+    Generator.PAGE_SIZE = arguments.bqrs_page_size
+
+    if not arguments.disable_result_cache:
+        # `--disable-cache` refreshes the cached results
+        Generator.CACHE = ResultCache(
+            arguments.cache_dir or os.path.join(temppath, "results"),
+            read=not arguments.disable_cache,
+        )
+        if arguments.clear_result_cache:
+            Generator.CACHE.clear()
+    if not arguments.disable_compilation_cache:
+        Generator.COMPILATION_CACHE = os.path.abspath(
+            arguments.compilation_cache or os.path.join(temppath, "compilation-cache")
+        )
+        os.makedirs(Generator.COMPILATION_CACHE, exist_ok=True)
+    elif arguments.precompile:
+        raise Exception("`--precompile` requires the compilation cache")
+
+    if arguments.jobs > 1 or arguments.max_threads or arguments.max_ram:
+        # Concurrent evaluations would each use every core otherwise
+        Generator.SCHEDULER = Scheduler(
+            arguments.jobs,
+            threads=arguments.max_threads,
+            ram=parseSize(arguments.max_ram) // 1048576 if arguments.max_ram else None,
+        )
+    if arguments.query_timeout:
+        Generator.QUERY_TIMEOUT = parseDuration(arguments.query_timeout)
+    if arguments.database_timeout:
+        Generator.DATABASE_TIMEOUT = parseDuration(arguments.database_timeout)
+    CodeQLServer.ENABLED = arguments.cli_server
+    if arguments.cli_cache_ttl > 0:
+        utils.CODEQL_CLI_CACHE = os.path.join(temppath, "codeql-cli")
+        utils.CODEQL_CLI_CACHE_TTL = arguments.cli_cache_ttl
 
     if arguments.language:
         languages.extend(arguments.language.split(","))
@@ -122,12 +301,7 @@ def main(arguments):
             )
 
             if github.available:
-                try:
-                    database.path = database.downloadDatabase(github, temppath)
-                except Exception as err:
-                    logger.warning(
-                        f"Error encountered while downloading CodeQL Database: {err}"
-                    )
+                logger.debug("Database will be downloaded from GitHub")
             elif arguments.database:
                 logger.debug("Setting database to arguments.database ")
                 database.path = arguments.database
@@ -152,19 +326,7 @@ def main(arguments):
                 _, name = repo.split("/")
                 db = CodeQLDatabase(name=name, language=lang, repository=repo)
 
-                if github.available and db.repository:
-                    logger.info(f"Downloading database for :: {repo}")
-
-                    try:
-                        db.path = db.downloadDatabase(
-                            github, temppath, use_cache=not arguments.disable_cache
-                        )
-                    except Exception as err:
-                        logger.warning(
-                            f"Error encountered while downloading CodeQL Database: {err}"
-                        )
-
-                if not db.path:
+                if not github.available:
                     logger.warning(f"CodeQL Database path is not set")
 
                 databases.append(db)
@@ -175,9 +337,7 @@ def main(arguments):
         for language in languages:
             # find local db + language
             name = os.path.basename(arguments.database)
-            database = CodeQLDatabase(
-                name, path=arguments.database, language=language
-            )
+            database = CodeQLDatabase(name, path=arguments.database, language=language)
             databases.append(database)
 
         logger.info("Finished loading database from path")
@@ -185,44 +345,375 @@ def main(arguments):
     else:
         raise Exception("Failed to set mode of analysis")
 
+    if arguments.shard:
+        total = len(databases)
+        sizes = loadSizes(arguments.shard_sizes) if arguments.shard_sizes else None
+        databases = selectShard(databases, arguments.shard, sizes=sizes)
+        logger.info(f"Shard {arguments.shard} :: {len(databases)} of {total} databases")
+
     logger.info(f"Databases to process :: {len(databases)}")
 
-    for database in databases:
-        logger.info(f"Database setup complete: {database}")
+    exporter = EXPORTERS.get(arguments.format)
+    if not exporter:
+        raise Exception("Unknown or Unsupported exporter")
+
+    # Resolve (and optionally compile) the query packs before any database
+    # work starts
+    for language in sorted(set(database.language for database in databases)):
+        Generator.downloadPack(Generator.packName(language))
+        if arguments.precompile:
+            Generator.precompile(language)
+
+    cache = None
+    if arguments.cache_max_bytes:
+        cache = DatabaseCache(temppath, max_bytes=parseSize(arguments.cache_max_bytes))
+        logger.info(f"Database cache size :: {cache.size()} bytes")
+
+    # Records the progress of the run, so it can be resumed
+    journal = Journal(
+        arguments.journal or os.path.join(temppath, "journal.jsonl"),
+        inputs={
+            "format": arguments.format,
+            "output": os.path.abspath(arguments.output),
+            "input": os.path.abspath(arguments.input) if arguments.input else None,
+            "project_repo": arguments.project_repo,
+            "database": arguments.database,
+            "language": arguments.language,
+            "shard": arguments.shard,
+        },
+        resume=arguments.resume,
+    )
 
-        if not database.exists():
+    # Downloads, extraction and analysis run as separate stages so network
+    # and CPU bound work overlap
+    pipeline = Pipeline(
+        [
+            Stage(
+                "download",
+                lambda db: downloadStage(
+                    db, arguments, github, temppath, cache, journal
+                ),
+                concurrency=arguments.download_concurrency,
+            ),
+            Stage(
+                "extract",
+                lambda db: extractStage(db, arguments, temppath, cache, journal),
+                concurrency=arguments.extract_concurrency,
+            ),
+            Stage(
+                "analyze",
+                lambda db: analyzeStage(
+                    db, exporter, arguments, github, temppath, cache, journal
+                ),
+                concurrency=arguments.jobs,
+                # Largest databases first so they don't finish last
+                priority=analyzePriority,
+            ),
+        ]
+    )
+    completed = False
+    try:
+        pipeline.run(databases)
+
+        timed_out = [db for db in databases if journal.has(db, "timed-out")]
+        if timed_out:
             logger.warning(
-                f"Failed to find or download the CodeQL Database for '{database.name}'"
+                f"{len(timed_out)} database(s) ran out of time: "
+                + ", ".join(db.name for db in timed_out)
             )
+
+        # Timed out and partially exported databases can be retried (with
+        # larger budgets), so the run isn't complete
+        incomplete = []
+        for db in databases:
+            exported = journal.get(db, "exported")
+            if exported is None or exported.get("partial"):
+                incomplete.append(db)
+        if incomplete:
             logger.warning(
-                "Please consult the GitHub docs to find out how to build a CodeQL Database"
+                f"{len(incomplete)} database(s) weren't fully exported, "
+                "rerun with `--resume` to retry only those"
             )
-            logger.warning(DOCUMENTATION.get("codeql_setup"))
-            logger.warning("Skipping project until Database is available...")
-            continue
-
-        # find codeql
-        generator = Generator(database)
+        completed = not incomplete
+    finally:
+        try:
+            finalizer = FINALIZERS.get(arguments.format)
+            if finalizer:
+                # Files shared by all the databases are only written once
+                logger.info(f"Finalizing exporter :: {arguments.format}")
+                with span("finalize", "export", format=arguments.format):
+                    finalizer(databases, arguments.output, github=github)
+
+            # The output is only complete once it has been finalized
+            if completed:
+                journal.complete()
+        finally:
+            journal.close()
+
+        if cache:
+            # Everything has been released, so the cache can fit the budget
+            cache.evict()
+
+        for line in TRACER.summary():
+            logger.info(line)
+        if arguments.trace_file:
+            TRACER.writeChromeTrace(arguments.trace_file)
+
+        for line in RESOURCES.summary():
+            logger.info(line)
+        if arguments.resource_report:
+            RESOURCES.writeReport(arguments.resource_report)
+
+
+def cachePaths(database: CodeQLDatabase, temppath: str) -> Tuple[str, str]:
+    """Cached archive and extraction paths of a downloaded database"""
+    archive = os.path.join(temppath, database.database_folder + ".tar.gz")
+    return archive, os.path.join(temppath, database.database_folder)
+
+
+def archiveInputs(archive: str) -> Optional[dict]:
+    """Identify a downloaded archive for the run journal"""
+    if not os.path.exists(archive):
+        return None
+    metadata = loadMetadata(archive) or {}
+    return {
+        "etag": metadata.get("etag"),
+        "last_modified": metadata.get("last_modified"),
+        "size": os.path.getsize(archive),
+    }
+
+
+def downloadStage(
+    database: CodeQLDatabase,
+    arguments,
+    github: GitHub,
+    temppath: str,
+    cache: Optional[DatabaseCache] = None,
+    journal: Optional[Journal] = None,
+) -> CodeQLDatabase:
+    """Download the database archive (if the database is remote)"""
+    if database.path or not database.repository or not github.available:
+        return database
+
+    archive, extraction = cachePaths(database, temppath)
+    if cache:
+        # Pinned until the database has been extracted and analyzed
+        cache.acquire(archive, extraction)
+
+    inputs = archiveInputs(archive)
+    if journal and inputs and journal.done(database, "downloaded", **inputs):
+        # Not even checking whether the archive changed since
+        logger.info(f"Database already downloaded in this run :: {database.repository}")
+        database.archive = archive
+        return database
+
+    logger.info(f"Downloading database for :: {database.repository}")
+    try:
+        database.archive = database.downloadArchive(
+            github, temppath, use_cache=not arguments.disable_cache
+        )
+        # The download may have replaced the archive, identify what is there now
+        inputs = archiveInputs(archive)
+        if journal and inputs:
+            journal.record(database, "downloaded", **inputs)
+    except Exception as err:
+        logger.warning(f"Error encountered while downloading CodeQL Database: {err}")
+
+    if cache:
+        cache.update(archive)
+
+    return database
+
+
+def extractStage(
+    database: CodeQLDatabase,
+    arguments,
+    temppath: str,
+    cache: Optional[DatabaseCache] = None,
+    journal: Optional[Journal] = None,
+) -> CodeQLDatabase:
+    """Extract a downloaded database archive"""
+    if not database.archive:
+        return database
+
+    try:
+        database.path = database.extractArchive(
+            database.archive,
+            temppath,
+            minimal=arguments.extract_minimal,
+            threads=arguments.extract_threads,
+        )
+        if journal:
+            # Extractions are reused based on their stamp, recorded for reference
+            stamp = loadStamp(
+                os.path.join(cachePaths(database, temppath)[1], EXTRACTION_STAMP)
+            )
+            journal.record(
+                database,
+                "extracted",
+                sha256=(stamp or {}).get("sha256"),
+                minimal=arguments.extract_minimal,
+            )
+    except Exception as err:
+        logger.warning(f"Error encountered while extracting CodeQL Database: {err}")
+
+    if not database.path:
+        logger.warning("CodeQL Database path is not set")
+
+    if cache:
+        archive, extraction = cachePaths(database, temppath)
+        cache.update(extraction)
+        cache.release(archive)
+
+    return database
+
+
+def analyzePriority(database: CodeQLDatabase) -> int:
+    """Databases are analyzed largest first"""
+    if not Generator.SCHEDULER or not database.exists():
+        return 0
+    return Generator.SCHEDULER.databaseSize(database.path)
+
+
+def analyzeStage(
+    database: CodeQLDatabase,
+    exporter,
+    arguments,
+    github: GitHub,
+    temppath: str,
+    cache: Optional[DatabaseCache] = None,
+    journal: Optional[Journal] = None,
+) -> bool:
+    """Analyze and export a database"""
+    try:
+        with span("analyze", "database", database=database.name), RESOURCES.label(
+            database=database.repository or database.name
+        ):
+            return processDatabase(database, exporter, arguments, github, journal)
+    finally:
+        if cache and database.repository:
+            cache.release(*cachePaths(database, temppath))
+
+
+# Exporters can write to files shared across databases (e.g. a single `json`
+# output file), so only one database is exported at a time. Files aggregating
+# every database are written afterwards by the exporter's finalizer.
+EXPORT_LOCK = threading.Lock()
+
+
+def processDatabase(
+    database: CodeQLDatabase,
+    exporter,
+    arguments,
+    github: GitHub,
+    journal: Optional[Journal] = None,
+) -> bool:
+    """Run the model generator queries and exporter for a single database"""
+    logger.info(f"Database setup complete: {database}")
+
+    if not database.exists():
+        logger.warning(
+            f"Failed to find or download the CodeQL Database for '{database.name}'"
+        )
+        logger.warning(
+            "Please consult the GitHub docs to find out how to build a CodeQL Database"
+        )
+        logger.warning(DOCUMENTATION.get("codeql_setup"))
+        logger.warning("Skipping project until Database is available...")
+        return False
+
+    # find codeql
+    generator = Generator(database)
+
+    # What the exported models depend on (the format and output are part of
+    # the run's inputs)
+    export_inputs = {
+        "identity": database.identity(),
+        "pack_version": generator.pack_version,
+        "cli_version": Generator.cliVersion(),
+    }
+    # Finalizers need every database, so those are always exported (using
+    # the cached query results)
+    if (
+        journal
+        and export_inputs["identity"]
+        and not FINALIZERS.get(arguments.format)
+        and journal.done(database, "exported", **export_inputs)
+    ):
+        logger.info(
+            f"Database already exported in this run, skipping :: {database.name}"
+        )
+        return True
 
-        # generate models
-        # https://github.com/github/codeql/blob/main/misc/scripts/models-as-data/generate_flow_model.py
+    # Timed out databases are only retried with larger budgets
+    timeout_inputs = dict(
+        export_inputs,
+        query_timeout=Generator.QUERY_TIMEOUT,
+        database_timeout=Generator.DATABASE_TIMEOUT,
+    )
+    if (
+        journal
+        and export_inputs["identity"]
+        and journal.done(database, "timed-out", **timeout_inputs)
+    ):
+        logger.info(f"Database timed out in this run, skipping :: {database.name}")
+        return False
+
+    # generate models
+    # https://github.com/github/codeql/blob/main/misc/scripts/models-as-data/generate_flow_model.py
+
+    queries = {}
+    for name, query in QUERIES.items():
+        query_path = generator.getModelGeneratorQuery(name)
+        if not query_path:
+            continue
+        queries[name] = query_path
+
+    # Queries that ran out of time are left out of the export
+    timed_out = []
+    if arguments.disable_batch_queries:
+        for name, query_path in queries.items():
+            try:
+                database.summaries[name] = generator.runQuery(query_path)
+            except TimeoutExpired as err:
+                logger.warning(f"Query timed out :: {query_path} ({err})")
+                timed_out.append(name)
+    else:
+        try:
+            database.summaries.update(generator.runQueries(queries))
+        except TimeoutExpired as err:
+            logger.warning(f"Queries timed out :: {database.name} ({err})")
+            timed_out.extend(queries.keys())
+
+    if timed_out:
+        count("timeout.query", len(timed_out))
+    if timed_out and len(timed_out) == len(queries):
+        count("timeout.database")
+        if journal:
+            journal.record(database, "timed-out", **timeout_inputs)
+        return False
+    elif timed_out:
+        logger.warning(
+            f"Exporting partial models without {', '.join(timed_out)} :: {database.name}"
+        )
 
-        for name, query in QUERIES.items():
-            query_path = generator.getModelGeneratorQuery(name)
-            if not query_path:
-                continue
-            database.summaries[name] = generator.runQuery(query_path)
+    for summary, data in database.summaries.items():
+        logger.info(f" Summary('{summary}', rows='{len(data)}')")
 
-        for summary, data in database.summaries.items():
-            logger.info(f" Summary('{summary}', rows='{len(data.rows)}')")
+    logger.info(f"Running exporter :: {arguments.format}")
 
-        logger.info(f"Running exporter :: {arguments.format}")
+    with EXPORT_LOCK, span("export", "export", database=database.name):
+        exporter(database, arguments.output, github=github)
 
-        exporter = EXPORTERS.get(arguments.format)
-        if not exporter:
-            raise Exception("Unknown or Unsupported exporter")
+    if journal:
+        # Partial exports are retried on resume (only the timed out queries
+        # run again, the others' results are cached)
+        if timed_out:
+            journal.record(database, "exported", partial=timed_out, **export_inputs)
+        else:
+            journal.record(database, "exported", **export_inputs)
 
-        exporter(database, arguments.output, github=github)
+    return True
 
 
 if __name__ == "__main__":
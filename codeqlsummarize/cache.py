@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import *
+
+from codeqlsummarize.models import EXTRACTION_STAMP, Summaries
+from codeqlsummarize.utils import atomicWrite, metadataPath
+
+logger = logging.getLogger("codeqlsummarize.cache")
+
+
+class ResultCache:
+    """Content-addressed cache of decoded query results.
+
+    Entries are keyed on everything that affects a query's results: the
+    database identity (its repository, language and metadata), the query
+    pack and its version, the query and the CodeQL CLI version.
+    """
+
+    def __init__(self, path: str, read: bool = True):
+        self.path = path
+        # Lookups can be disabled to refresh the cache
+        self.read = read
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """Create a cache key from its parts"""
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def entryPath(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[Summaries]:
+        if not self.read:
+            return None
+
+        path = self.entryPath(key)
+        if not os.path.exists(path):
+            logger.debug(f"Result cache miss :: {key}")
+            return None
+
+        try:
+            with open(path, "r") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring corrupt result cache entry {key}: {err}")
+            return None
+
+        logger.debug(f"Result cache hit :: {key}")
+        return Summaries(data.get("rows", []))
+
+    def put(self, key: str, summaries: Summaries, **metadata):
+        path = self.entryPath(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        data = {"metadata": metadata, "rows": [str(row) for row in summaries.rows]}
+
+        # Readers never see partially written entries
+        with atomicWrite(path) as handle:
+            json.dump(data, handle)
+
+    def clear(self):
+        """Remove all cached results"""
+        logger.info(f"Clearing result cache :: {self.path}")
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+
+class DatabaseCache:
+    """Disk-budgeted cache of downloaded database archives and extractions.
+
+    Archives and extracted databases are tracked as separate entries with
+    their size and last use. When the cache grows over `max_bytes`, the
+    least recently used entries are evicted. Entries in use by this or any
+    other running process are never evicted.
+    """
+
+    INDEX = "databases.json"
+    INUSE = ".inuse"
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self._lock = threading.RLock()
+        self._pins: Dict[str, int] = {}
+
+        os.makedirs(os.path.join(self.path, DatabaseCache.INUSE), exist_ok=True)
+        self.entries: Dict[str, dict] = self._loadIndex()
+        self._discover()
+
+    def _loadIndex(self) -> Dict[str, dict]:
+        try:
+            with open(os.path.join(self.path, DatabaseCache.INDEX), "r") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _saveIndex(self):
+        index = os.path.join(self.path, DatabaseCache.INDEX)
+        with atomicWrite(index) as handle:
+            json.dump(self.entries, handle, indent=2, sort_keys=True)
+
+    def _discover(self):
+        """Track archives and extractions created before the index existed"""
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name in self.entries:
+                continue
+            if name.endswith(".tar.gz") or os.path.exists(
+                os.path.join(path, EXTRACTION_STAMP)
+            ):
+                self.entries[name] = {
+                    "size": entrySize(path),
+                    "last_used": os.path.getmtime(path),
+                }
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.path)
+
+    def _pinPath(self, key: str) -> str:
+        return os.path.join(self.path, DatabaseCache.INUSE, f"{key}.{os.getpid()}")
+
+    def acquire(self, *paths: str):
+        """Mark entries as in use so they aren't evicted"""
+        with self._lock:
+            for path in paths:
+                key = self._key(path)
+                self._pins[key] = self._pins.get(key, 0) + 1
+                if self._pins[key] == 1:
+                    # Visible to other processes sharing the cache
+                    open(self._pinPath(key), "w").close()
+
+    def release(self, *paths: str):
+        """Entries are no longer in use"""
+        with self._lock:
+            for path in paths:
+                key = self._key(path)
+                if key not in self._pins:
+                    continue
+                self._pins[key] -= 1
+                if self._pins[key] == 0:
+                    del self._pins[key]
+                    if os.path.exists(self._pinPath(key)):
+                        os.remove(self._pinPath(key))
+
+    def inUse(self, key: str) -> bool:
+        if key in self._pins:
+            return True
+
+        # Pins from other processes, ignoring processes that have died
+        prefix = key + "."
+        for pin in os.listdir(os.path.join(self.path, DatabaseCache.INUSE)):
+            if not pin.startswith(prefix):
+                continue
+            pid = pin[len(prefix) :]
+            if not pid.isdigit():
+                continue
+            if processAlive(int(pid)):
+                return True
+            os.remove(os.path.join(self.path, DatabaseCache.INUSE, pin))
+        return False
+
+    def update(self, path: str):
+        """Record the size and use of an entry, evicting others if needed"""
+        with self._lock:
+            key = self._key(path)
+            if not os.path.exists(path):
+                self.entries.pop(key, None)
+            else:
+                self.entries[key] = {"size": entrySize(path), "last_used": time.time()}
+
+            # The updated entry is being used right now
+            self.evict(keep=[key])
+
+    def size(self) -> int:
+        return sum(entry.get("size", 0) for entry in self.entries.values())
+
+    def evict(self, keep: Optional[List[str]] = None):
+        """Evict least recently used entries until the cache fits the budget"""
+        keep = keep or []
+        with self._lock:
+            if self.max_bytes is None:
+                self._saveIndex()
+                return
+
+            total = self.size()
+            ordered = sorted(self.entries.items(), key=lambda e: e[1]["last_used"])
+
+            for key, entry in ordered:
+                if total <= self.max_bytes:
+                    break
+                if key in keep or self.inUse(key):
+                    continue
+
+                logger.info(
+                    f"Evicting cached database :: {key} ({entry['size']} bytes)"
+                )
+                removeEntry(os.path.join(self.path, key))
+                del self.entries[key]
+                total -= entry["size"]
+
+            if total > self.max_bytes:
+                logger.warning(
+                    f"Database cache is over budget ({total} > {self.max_bytes} bytes) "
+                    "with entries in use"
+                )
+            self._saveIndex()
+
+
+def entrySize(path: str) -> int:
+    """Size of an archive (with its partial download) or an extracted tree"""
+    if os.path.isfile(path):
+        return sum(
+            os.path.getsize(p) for p in [path, path + ".part"] if os.path.exists(p)
+        )
+
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def removeEntry(path: str):
+    """Remove an archive (with its metadata) or an extracted tree"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+
+    for cached in [path, path + ".part"]:
+        for p in [cached, metadataPath(cached)]:
+            if os.path.exists(p):
+                os.remove(p)
+
+
+def processAlive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -1,10 +1,25 @@
-from codeqlsummarize.exporters.exptjson import exportToJson
-from codeqlsummarize.exporters.customizations import exportBundle, exportCustomizations
+from codeqlsummarize.exporters.exptjson import (
+    exportToJson,
+    exportToJsonLines,
+    finalizeJsonLines,
+)
+from codeqlsummarize.exporters.customizations import (
+    exportBundle,
+    exportCustomizations,
+    finalizeBundle,
+)
 from codeqlsummarize.exporters.extensions import exportDataExtensions
 
 EXPORTERS = {
     "json": exportToJson,
+    "json-lines": exportToJsonLines,
     "extensions": exportDataExtensions,
     "customizations": exportCustomizations,
     "bundle": exportBundle,
 }
+
+# Run once after all the databases have been exported
+FINALIZERS = {
+    "bundle": finalizeBundle,
+    "json-lines": finalizeJsonLines,
+}
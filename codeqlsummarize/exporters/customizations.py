@@ -1,11 +1,10 @@
 import os
-import json
 import logging
-from dataclasses import asdict
+import threading
+from typing import *
 
-from codeqlsummarize.models import CodeQLDatabase, GitHub
-from codeqlsummarize.generator import QUERIES
-from codeqlsummarize.utils import findCodeQLCli
+from codeqlsummarize.models import CodeQLDatabase, GitHub, ModelRow
+from codeqlsummarize.utils import atomicWrite, formatStream
 
 logger = logging.getLogger("codeqlsummarize.exporters")
 
@@ -30,48 +29,49 @@ private class {name}{type}Custom extends {models}Csv {{
 """
 
 
+# Models in the order of the `CODEQL_LIBRARY` template
+MODELS = ["SinkModel", "SourceModel", "SummaryModel"]
+
+
+def customizationRows(rows: Iterable[ModelRow]) -> Iterator[str]:
+    padding = " " * 6
+    for index, mad in enumerate(rows):
+        if index:
+            yield ",\n"
+        yield f'{padding}"{mad}"'
+
+
 def saveQLL(
     database: CodeQLDatabase, output_customizations: str, github: GitHub, **kargs
 ):
-    padding = " " * 6
     owner = github.owner.replace("-", "_").lower()
 
-    models = {}
+    models: Dict[str, Union[str, Iterator[str]]] = {}
     # initially populate data
-    for key in QUERIES.keys():
+    for key in MODELS:
         models[key] = "// NOT SET"
 
     for sname, summary in database.summaries.items():
-        rows = ""
-        counter = 1
-
-        if len(summary.rows) == 0:
+        if len(summary) == 0:
             models[sname] = f"// No {sname} found\n"
             continue
-        for mad in sorted(summary.rows):
-            rows += f'{padding}"{mad}"'
-
-            if len(summary.rows) > counter:
-                rows += ",\n"
-            counter += 1
 
         # generate codeql lib for dabase
-        custom = CODEQL_CUSTOMIZATION.format(
+        models[sname] = formatStream(
+            CODEQL_CUSTOMIZATION,
             name=database.display_name(owner=owner),
             type=sname,
             models=sname,
-            rows=rows,
+            rows=customizationRows(summary.rows),
         )
 
-        models[sname] = custom
-
     logger.debug(f"List of models: {models.keys()}")
 
-    # Generate Customizations.qll
-    data = CODEQL_LIBRARY.format(language=database.language, **models)
-
-    with open(output_customizations, "w") as handle:
-        handle.write(data)
+    # Generate Customizations.qll, streaming the rows straight to the file
+    with atomicWrite(output_customizations) as handle:
+        handle.writelines(
+            formatStream(CODEQL_LIBRARY, language=database.language, **models)
+        )
 
     return
 
@@ -116,73 +116,121 @@ module {owner} {{
 """
 
 
+# `codeql pack init` runs once per pack, even with databases exported concurrently
+_bundle_lock = threading.Lock()
+
+
+def bundlePaths(language: str, output: str, github: GitHub) -> Tuple[str, str]:
+    """Root of the bundle pack for a language and its generated library folder"""
+    owner = github.owner.replace("-", "_").lower()
+    codeql_pack_path = f"{language}-summarize"
+
+    root = os.path.join(output, codeql_pack_path)
+    sub = os.path.join(root, owner, codeql_pack_path.replace("-", "_"))
+    return root, sub
+
+
+def initBundle(language: str, output: str, github: GitHub) -> str:
+    """Create the bundle pack for a language (if needed)"""
+    root, sub = bundlePaths(language, output, github)
+
+    with _bundle_lock:
+        if not os.path.exists(root):
+            codeql = findCodeQLCli()
+            if codeql:
+                logger.info("Generating CodeQL Summarize Pack")
+                codeql(
+                    "pack",
+                    "init",
+                    "--version=0.0.1",
+                    "--extractor",
+                    language,
+                    os.path.basename(root),
+                    cwd=output,
+                )
+
+        if not os.path.exists(os.path.join(root, "qlpack.yml")):
+            raise Exception("Pack wasn't found")
+
+        logger.debug(f"Checking sub pack path exists: {sub}")
+        os.makedirs(sub, exist_ok=True)
+
+    return sub
+
+
 def exportBundle(database: CodeQLDatabase, output: str, github: GitHub, **kargs):
+    """Write the generated library of a database into the bundle pack.
+
+    The pack's `Customizations.qll` and metadata are written once all the
+    databases have been exported by `finalizeBundle`.
+    """
     logger.debug(f"Output directory :: {output}")
 
+    if not github or not github.owner:
+        raise Exception("Failed to export Bundle: No owner / repo name set")
+
     owner = github.owner.replace("-", "_").lower()
 
+    sub = initBundle(database.language, output, github)
+
+    name = database.display_name(owner=owner) + "Generated"
+
+    db_custom_lib_path = os.path.join(sub, name + ".qll")
+    saveQLL(database, db_custom_lib_path, github)
+
+    return
+
+
+def finalizeBundle(
+    databases: List[CodeQLDatabase], output: str, github: GitHub, **kargs
+):
+    """Write the `Customizations.qll` and pack metadata of each bundle pack"""
     if not github or not github.owner:
         raise Exception("Failed to export Bundle: No owner / repo name set")
 
-    codeql_pack_path = f"{database.language}-summarize"
-    codeql_pack_name = f"{owner}/{codeql_pack_path}"
+    owner = github.owner.replace("-", "_").lower()
 
-    # Create root for language
-    root = os.path.join(output, codeql_pack_path)
+    for language in sorted(set(database.language for database in databases)):
+        root, sub = bundlePaths(language, output, github)
+        if not os.path.exists(sub):
+            logger.debug(f"No generated libraries for {language}, skipping bundle")
+            continue
 
-    codeql = findCodeQLCli()
+        writeBundleMetadata(root, sub, language, owner)
 
-    if not os.path.exists(root) and codeql:
-        logger.info("Generating CodeQL Summarize Pack")
-        codeql("pack", "init", "--version=0.0.1", "--extractor", database.language, codeql_pack_path, cwd=output)
+    return
 
-    if not os.path.exists(os.path.join(root, "qlpack.yml")):
-        raise Exception("Pack wasn't found")
+
+def writeBundleMetadata(root: str, sub: str, language: str, owner: str):
+    """Write the README and the `Customizations.qll` importing every
+    generated library in the pack (including ones from previous runs)"""
+    logger.debug(f"Root Pack Path :: {root}")
 
     # Create README
     readme = os.path.join(root, "README.md")
     if not os.path.exists(readme):
-        with open(readme, "w") as handle:
+        with atomicWrite(readme) as handle:
             handle.write("# CodeQL Summarize Pack\n")
 
-    logger.debug(f"Root Pack Path :: {root}")
-
-    # Create language subfolder (if needed)
-    sub = os.path.join(root, owner, codeql_pack_path.replace("-", "_"))
-    logger.debug(f"Checking sub pack path exists: {sub}")
-    os.makedirs(sub, exist_ok=True)
-
-    name = database.display_name(owner=owner) + "Generated"
-
-    db_custom_lib_path = os.path.join(sub, name + ".qll")
-    saveQLL(database, db_custom_lib_path, github)
-
-    # Dynamically update Customizations.qll
     customizations_path = os.path.join(sub, "Customizations.qll")
     customizations_data = ""
-    
-    codeql_files = os.listdir(sub)
-    if not codeql_files:
-        logger.error(f"This is a major issue and please report in the GitHub issues")
-        raise Exception("Something is really wrong here...")
-
-    for custom in codeql_files:
-        if custom == "Customizations.qll":
+
+    for custom in sorted(os.listdir(sub)):
+        if custom == "Customizations.qll" or not custom.endswith(".qll"):
             continue
-        
+
         custom = custom.replace(".qll", "")
 
-        impt = f"    private import {owner}.{database.language}_summarize.{custom}\n"
+        impt = f"    private import {owner}.{language}_summarize.{custom}\n"
 
         customizations_data += impt
 
-    with open(customizations_path, "w") as handle:
+    logger.info(f"Updating bundle customizations :: {customizations_path}")
+    with atomicWrite(customizations_path) as handle:
         handle.write(
             CODEQL_CUSTOMIZATIONS_QLL.format(
-                language=database.language,
+                language=language,
                 custom=customizations_data,
                 owner=owner,
             )
         )
-
-    return
@@ -1,9 +1,11 @@
 import os
 import json as js
+import shutil
 import logging
+from typing import *
 
 from codeqlsummarize.models import CodeQLDatabase
-
+from codeqlsummarize.utils import atomicWrite
 
 logger = logging.getLogger("codeqlsummarize.exporters.json")
 
@@ -12,14 +14,98 @@ def exportToJson(database: CodeQLDatabase, output: str, **kargs):
     """Export to JSON"""
     logger.info("Running export to JSON")
 
-    data = {}
-    for name, summary in database.summaries.items():
-        data[name] = summary.rows
-
     logger.info(f"Saving output to file: {output}")
-    with open(output, "w") as handle:
-        js.dump(data, handle, indent=2, sort_keys=True)
+    with atomicWrite(output, compress=output.endswith(".gz")) as handle:
+        handle.writelines(jsonStream(database))
 
     logger.info("Completed writing to output")
 
     return
+
+
+def jsonStream(database: CodeQLDatabase) -> Iterator[str]:
+    """Stream the summaries in the `json.dump(indent=2, sort_keys=True)` layout"""
+    names = sorted(database.summaries.keys())
+    if not names:
+        yield "{}"
+        return
+
+    yield "{"
+    for index, name in enumerate(names):
+        yield ",\n" if index else "\n"
+        yield f"  {js.dumps(name)}: "
+
+        summaries = database.summaries[name]
+        if not summaries:
+            yield "[]"
+            continue
+
+        yield "["
+        for row_index, row in enumerate(summaries.rows):
+            yield ",\n    " if row_index else "\n    "
+            yield js.dumps(str(row))
+        yield "\n  ]"
+    yield "\n}"
+
+
+def exportToJsonLines(database: CodeQLDatabase, output: str, **kargs):
+    """Export to JSON Lines, one model per line.
+
+    Each database is written to its own part file as the rows are produced
+    and `finalizeJsonLines` joins the parts into `output` once all the
+    databases have been exported.
+    """
+    logger.info("Running export to JSON Lines")
+
+    part = jsonLinesPart(database, output)
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+
+    logger.debug(f"Saving output to part file: {part}")
+    with atomicWrite(part, compress=output.endswith(".gz")) as handle:
+        handle.writelines(jsonLinesStream(database))
+
+    return
+
+
+def finalizeJsonLines(databases: List[CodeQLDatabase], output: str, **kargs):
+    """Join the part files of the exported databases into `output`"""
+    parts_dir = output + ".parts"
+
+    logger.info(f"Saving output to file: {output}")
+    # Compressed parts are gzip members, so they can be joined as-is
+    with atomicWrite(output, "wb") as handle:
+        for database in databases:
+            part = jsonLinesPart(database, output)
+            if not os.path.exists(part):
+                continue
+            with open(part, "rb") as source:
+                shutil.copyfileobj(source, handle, 1024 * 1024)
+
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    logger.info("Completed writing to output")
+
+
+def jsonLinesPart(database: CodeQLDatabase, output: str) -> str:
+    """Part file of a database for a JSON Lines output"""
+    name = f"{database.database_folder}-{database.name}-{database.language}.jsonl"
+    if output.endswith(".gz"):
+        name += ".gz"
+    return os.path.join(output + ".parts", name)
+
+
+def jsonLinesStream(database: CodeQLDatabase) -> Iterator[str]:
+    """Stream the summaries with one JSON object per model"""
+    for name in sorted(database.summaries.keys()):
+        for row in database.summaries[name].rows:
+            yield js.dumps(
+                {
+                    "name": database.name,
+                    "repository": database.repository,
+                    "language": database.language,
+                    "model": name,
+                    "row": str(row),
+                },
+                separators=(",", ":"),
+            )
+            yield "\n"
@@ -1,8 +1,11 @@
 import os
 import yaml
 import logging
+import threading
+from typing import *
 
-from codeqlsummarize.models import CodeQLDatabase, GitHub
+from codeqlsummarize.models import CodeQLDatabase, GitHub, ModelRow
+from codeqlsummarize.utils import atomicWrite, formatStream
 
 logger = logging.getLogger("codeqlsummarize.exporters.extensions")
 
@@ -21,7 +24,9 @@ EXTENSIBLE = {
 }
 
 
-def exportDataExtensions(database: CodeQLDatabase, output: str, github: GitHub, **kargs):
+def exportDataExtensions(
+    database: CodeQLDatabase, output: str, github: GitHub, **kargs
+):
     logger.info("Running export to Data Extensions")
 
     if database.language == "javascript":
@@ -33,46 +38,85 @@ def exportDataExtensions(database: CodeQLDatabase, output: str, github: GitHub,
     os.makedirs(os.path.join(codeqlPack, "generated"), exist_ok=True)
 
     if database.owner:
-        os.makedirs(os.path.join(codeqlPack, "generated", database.owner), exist_ok=True)
-        extensions_file = os.path.join(codeqlPack, "generated", database.owner, f"{database.name}.yml")
+        os.makedirs(
+            os.path.join(codeqlPack, "generated", database.owner), exist_ok=True
+        )
+        extensions_file = os.path.join(
+            codeqlPack, "generated", database.owner, f"{database.name}.yml"
+        )
     else:
         extensions_file = os.path.join(codeqlPack, "generated", f"{database.name}.yml")
 
-    data = "extensions:\n"
-    for sname, summary in database.summaries.items():
-        if len(summary.rows) == 0:
+    logger.info(f"Writing Data Extensions to: {extensions_file}")
+    with atomicWrite(extensions_file) as handle:
+        handle.write("extensions:\n")
+
+        for sname, summary in database.summaries.items():
+            if len(summary) == 0:
+                continue
+
+            handle.writelines(
+                formatStream(
+                    CODEQL_EXTENSION,
+                    rows=extensionRows(summary.rows),
+                    language=database.language,
+                    extensible=EXTENSIBLE.get(sname, "sinkModel"),
+                )
+            )
+
+
+def extensionRows(rows: Iterable[ModelRow]) -> Iterator[str]:
+    for m in rows:
+        yield f'      - ["{m[0]}", "{m[1]}", {m[2]}, "{m[3]}", "{m[4]}", "{m[5]}", "{m[6]}", "{m[7]}", "{m[8]}"]\n'
+
+
+# Directories that never contain the output packs. `generated/` keeps growing
+# with every run, so walking it would slow down each lookup.
+PACK_INDEX_SKIP = {"generated", ".git", ".codeql", "node_modules", "__pycache__"}
+
+_pack_index: Dict[str, Dict[str, str]] = {}
+_pack_index_lock = threading.Lock()
+
+
+def indexCodeQLPacks(location: str) -> Dict[str, str]:
+    """Map each language to the first CodeQL pack in the location targeting it"""
+    index: Dict[str, str] = {}
+
+    for root, dirs, files in os.walk(location):
+        dirs[:] = sorted(d for d in dirs if d not in PACK_INDEX_SKIP)
+
+        if "qlpack.yml" not in files:
             continue
 
-        summary_rows = ""
-        for mad in sorted(summary.rows):
-            m = mad.split(";")
-            summary_rows += "      - "
-            summary_rows += f'["{m[0]}", "{m[1]}", {m[2]}, "{m[3]}", "{m[4]}", "{m[5]}", "{m[6]}", "{m[7]}", "{m[8]}"]\n'
+        with open(os.path.join(root, "qlpack.yml"), "r") as f:
+            qlpack = yaml.safe_load(f) or {}
 
-        data += CODEQL_EXTENSION.format(
-            rows=summary_rows,
-            language=database.language,
-            extensible=EXTENSIBLE.get(sname, "sinkModel")
-        )
+        for target in qlpack.get("extensionTargets") or []:
+            if target.startswith("codeql/") and target.endswith("-queries"):
+                index.setdefault(target[len("codeql/") : -len("-queries")], root)
 
-    logger.info(f"Writing Data Extensions to: {extensions_file}")
-    with open(extensions_file, "w") as handle:
-        handle.write(data)
+    logger.debug(f"Indexed CodeQL packs in {location} :: {index}")
+    return index
 
 
 def findCodeQLPack(location: str, language: str) -> str:
-    """Find the CodeQL pack for the given language in the output directory"""
+    """Find the CodeQL pack for the given language in the output directory.
+
+    The output directory is indexed once and reused for the following
+    lookups, only re-indexing when a language's pack is missing.
+    """
 
     if os.path.isfile(location):
         raise Exception(f"Directory {location} does not exist")
 
-    for root, dirs, files in os.walk(location):
-        for file in files:
-            if file == "qlpack.yml":
-                with open(os.path.join(root, file), "r") as f:
-                    qlpack = yaml.safe_load(f)
-                    
-                    if f"codeql/{language}-queries" in qlpack.get("extensionTargets", []):
-                        return root
+    key = os.path.realpath(location)
+
+    with _pack_index_lock:
+        index = _pack_index.get(key)
+        if index is None or language not in index:
+            index = _pack_index[key] = indexCodeQLPacks(location)
+
+        if language in index:
+            return index[language]
 
     raise Exception(f"Could not find CodeQL pack for {language} in {location}")
@@ -1,20 +1,24 @@
 # File from CodeQL GitHub repo
 # https://github.com/github/codeql/blob/main/misc/scripts/models-as-data/generate_flow_model.py
 
+import io
+import csv
 import json
 import os
-from os.path import join, exists, realpath
-import shlex
+from os.path import join, exists
 import tempfile
+import time
 import logging
+import threading
 from typing import *
-from codeqlsummarize.utils import (
-    findCodeQLCli,
-    exec_from_path_env,
-    print_to_stream,
-)
-from codeqlsummarize import __MODULE_PATH__
+from subprocess import TimeoutExpired
+from contextlib import contextmanager
+from codeqlsummarize.utils import RESOURCES, CodeQLServer, Executable, findCodeQLCli
+from codeqlsummarize.cache import ResultCache
 from codeqlsummarize.models import CodeQLDatabase, Summaries
+from codeqlsummarize.process import OutputBuffer
+from codeqlsummarize.scheduler import Scheduler
+from codeqlsummarize.trace import count, span
 
 logger = logging.getLogger("codeqlsummarize.generator")
 
@@ -29,17 +33,185 @@ QUERIES = {
 
 class Generator:
     TEMP_PATH = join(tempfile.gettempdir(), "codeqlsummarize")
+    # Decode BQRS results in pages of this many rows (None decodes all at once)
+    PAGE_SIZE: Optional[int] = None
+    # Cache of decoded query results (None disables caching)
+    CACHE: Optional[ResultCache] = None
+    # Splits cores and memory between concurrent evaluations (None lets each
+    # evaluation use all the cores)
+    SCHEDULER: Optional[Scheduler] = None
+    # Compiled queries are shared by all evaluations (and runs) through this
+    # directory (None uses the CLI's own cache)
+    COMPILATION_CACHE: Optional[str] = None
+    # Wall-clock budgets (seconds) of each query evaluation and of all the
+    # evaluations of a database (None is unlimited)
+    QUERY_TIMEOUT: Optional[float] = None
+    DATABASE_TIMEOUT: Optional[float] = None
 
-    codeql: Optional[str] = None
+    _cli_version: ClassVar[Optional[str]] = None
+    _cli_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    # Set once the CLI is found, commands go through its server when enabled
+    codeql: Union[Executable, CodeQLServer]
+
+    # Query pack versions, each pack is only downloaded once per process
+    _packs: ClassVar[Dict[str, Optional[str]]] = {}
+    # Concurrent `pack download` calls race on the shared package cache
+    _pack_lock: ClassVar[threading.Lock] = threading.Lock()
 
     def __init__(self, database: CodeQLDatabase):
         self.database = database
-        self.codeql = findCodeQLCli()
-        if not self.codeql:
+        codeql = findCodeQLCli()
+        if not codeql:
+            raise Exception("Failed to find CodeQL distribution!")
+        self.codeql = codeql
+
+        # Scratch area for this database so concurrent generators don't collide
+        self.temppath = join(
+            Generator.TEMP_PATH,
+            "generator",
+            f"{database.database_folder}-{database.language}",
+        )
+        os.makedirs(self.temppath, exist_ok=True)
+
+        self.pack_name = Generator.packName(database.language)
+        self.pack_version = Generator.downloadPack(self.pack_name)
+
+        # End of the database's budget, from its first evaluation
+        self.deadline: Optional[float] = None
+
+    @staticmethod
+    def packName(language: str) -> str:
+        return f"codeql/{language}-queries"
+
+    @classmethod
+    def downloadPack(cls, pack_name: str) -> Optional[str]:
+        """Download the query pack (once) and return its resolved version"""
+        with cls._pack_lock:
+            if pack_name in cls._packs:
+                return cls._packs[pack_name]
+
+            codeql = findCodeQLCli()
+            if not codeql:
+                raise Exception("Failed to find CodeQL distribution!")
+
+            logger.info(f"Downloading CodeQL pack :: {pack_name}")
+            output = io.BytesIO()
+            with span("pack-download", "codeql", pack=pack_name), RESOURCES.label(
+                query=pack_name
+            ):
+                codeql(
+                    "pack",
+                    "download",
+                    "--format",
+                    "json",
+                    pack_name,
+                    combine_std_out_err=False,
+                    stdout=output,
+                )
+
+            version = None
+            try:
+                for pack in json.loads(output.getvalue()).get("packs", []):
+                    if pack.get("name") == pack_name:
+                        version = pack.get("version")
+            except ValueError:
+                logger.debug(f"Unexpected `pack download` output for {pack_name}")
+
+            cls._packs[pack_name] = version
+            return version
+
+    @classmethod
+    def cliVersion(cls) -> Optional[str]:
+        """Version of the CodeQL CLI"""
+        with Generator._cli_lock:
+            if Generator._cli_version is None:
+                codeql = findCodeQLCli()
+                if not codeql:
+                    raise Exception("Failed to find CodeQL distribution!")
+
+                output = io.BytesIO()
+                codeql(
+                    "version",
+                    "--format",
+                    "json",
+                    combine_std_out_err=False,
+                    stdout=output,
+                )
+                try:
+                    version = json.loads(output.getvalue()).get("version")
+                except ValueError:
+                    version = None
+                Generator._cli_version = version or ""
+        return Generator._cli_version or None
+
+    @classmethod
+    def compilationOptions(cls) -> List[str]:
+        if not cls.COMPILATION_CACHE:
+            return []
+        return ["--compilation-cache", cls.COMPILATION_CACHE]
+
+    @classmethod
+    def precompile(cls, language: str):
+        """Compile the model generator queries of a language into the
+        compilation cache, once per query pack and CLI version"""
+        if not cls.COMPILATION_CACHE:
+            raise Exception("Precompiling queries requires a compilation cache")
+
+        pack_name = Generator.packName(language)
+        pack_version = Generator.downloadPack(pack_name)
+        cli_version = Generator.cliVersion()
+
+        marker = None
+        if pack_version and cli_version:
+            marker = join(
+                cls.COMPILATION_CACHE,
+                "precompiled",
+                f"{pack_name.replace('/', '_')}-{pack_version}-{cli_version}",
+            )
+            if exists(marker):
+                logger.info(
+                    f"Queries already precompiled :: {pack_name}@{pack_version}"
+                )
+                return
+
+        codeql = findCodeQLCli()
+        if not codeql:
             raise Exception("Failed to find CodeQL distribution!")
 
-        self.pack_name = f"codeql/{database.language}-queries"
-        self.codeql("pack", "download", self.pack_name)
+        queries = [
+            f"{pack_name}:utils/modelgenerator/{query}" for query in QUERIES.values()
+        ]
+        logger.info(f"Precompiling queries :: {pack_name}@{pack_version}")
+        with span("precompile", "codeql", pack=pack_name), RESOURCES.label(
+            query=pack_name
+        ):
+            codeql(
+                "query",
+                "compile",
+                "--threads",
+                "0",
+                *cls.compilationOptions(),
+                *queries,
+            )
+
+        if marker:
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            open(marker, "w").close()
+
+    def cacheKey(self, query: str) -> Optional[str]:
+        """Result cache key for the query on this database"""
+        if not Generator.CACHE or not self.pack_version:
+            return None
+
+        identity = self.database.identity()
+        cli_version = self.cliVersion()
+        if not identity or not cli_version:
+            return None
+
+        return ResultCache.key(
+            identity, self.pack_name, self.pack_version, query, cli_version
+        )
 
     def getModelGeneratorQuery(self, name) -> Optional[str]:
         logger.info(f"Finding query name: {name}")
@@ -52,63 +224,162 @@ class Generator:
         # Find in this repo
         return None
 
-    def runQuery(self, query: str) -> Summaries:
-        logger.info("Running Query :: " + query)
-        resultBqrs = join(
+    def resultPath(self, query: str) -> str:
+        """Path of the BQRS file `run-queries` writes for the query"""
+        return join(
             self.database.path,
             "results",
             query.replace(":", "/").replace(".ql", ".bqrs"),
         )
 
-        output_std = join(Generator.TEMP_PATH, "runquery.txt")
+    def runQuery(self, query: str) -> Summaries:
+        logger.info("Running Query :: " + query)
+        return self.runQueries({query: query})[query]
 
-        print(f'Running query "{query}"...')
-        with open(output_std, "wb") as std:
+    def runQueries(self, queries: Dict[str, str]) -> Dict[str, Summaries]:
+        """Run multiple queries in a single `run-queries` invocation.
+
+        The evaluator only loads the database and the query pack once and
+        can share the intermediate relations the queries have in common.
+        """
+        summaries = {}
+        keys = {}
+        for name, query in list(queries.items()):
+            keys[name] = self.cacheKey(query)
+            cached = Generator.CACHE.get(keys[name]) if keys[name] else None
+            if cached is not None:
+                logger.info(f"Using cached results :: {query}")
+                summaries[name] = cached
+                count("result-cache.hit")
+            elif keys[name]:
+                count("result-cache.miss")
+
+        queries = {n: q for n, q in queries.items() if n not in summaries}
+        if not queries:
+            return summaries
+
+        logger.info(f"Running {len(queries)} queries :: {', '.join(queries.values())}")
+        output_std = join(self.temppath, "runquery.txt")
+
+        with self.allocate() as options, OutputBuffer(spill=output_std) as std, span(
+            "run-queries",
+            "codeql",
+            database=self.database.name,
+            queries=list(queries.values()),
+            options=options,
+        ), RESOURCES.label(query=",".join(queries.values())):
+            # Budget starts once the resources are allocated
             self.codeql(
                 "database",
                 "run-queries",
-                "--threads",
-                "0",
+                *options,
+                *Generator.compilationOptions(),
                 self.database.path,
-                query,
-                outconsumer=print_to_stream(std),
+                *queries.values(),
+                stdout=std,
+                timeout=self.timeout(len(queries)),
             )
 
-        rows = self.readRows(resultBqrs)
+        for name, query in queries.items():
+            with span(
+                "decode", "codeql", database=self.database.name, query=query
+            ), RESOURCES.label(query=query):
+                # Rows are stored as they are decoded, then sorted once
+                summaries[name] = Summaries(self.readRows(self.resultPath(query)))
+            logger.debug(f"Final Row Summary count: {len(summaries[name])}")
+            if keys[name]:
+                Generator.CACHE.put(
+                    keys[name],
+                    summaries[name],
+                    database=self.database.name,
+                    query=query,
+                    pack_version=self.pack_version,
+                )
+
+        return summaries
+
+    def timeout(self, queries: int = 1) -> Optional[float]:
+        """Wall-clock budget for evaluating `queries` queries, within what
+        is left of the database's budget"""
+        budgets = []
+        if Generator.QUERY_TIMEOUT:
+            budgets.append(Generator.QUERY_TIMEOUT * queries)
+        if Generator.DATABASE_TIMEOUT:
+            if self.deadline is None:
+                self.deadline = time.monotonic() + Generator.DATABASE_TIMEOUT
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutExpired(
+                    f"analysis of {self.database.name}", Generator.DATABASE_TIMEOUT
+                )
+            budgets.append(remaining)
+        return min(budgets) if budgets else None
+
+    @contextmanager
+    def allocate(self) -> Iterator[List[str]]:
+        """Hold the cores and memory for an evaluation, as `run-queries` options"""
+        if not Generator.SCHEDULER:
+            yield ["--threads", "0"]
+            return
 
-        return Summaries(rows)
+        with Generator.SCHEDULER.allocate(self.database.path) as allocation:
+            options = ["--threads", str(allocation.threads)]
+            if allocation.ram:
+                options.extend(["--ram", str(allocation.ram)])
+            yield options
 
-    def readRows(self, bqrsFile):
+    def readRows(self, bqrsFile: str) -> Iterator[str]:
+        """Decode the rows of a BQRS file.
+
+        Rows are streamed from `codeql bqrs decode` and parsed as they
+        arrive. Large result sets are decoded in pages of `PAGE_SIZE` rows.
+        """
         logger.debug(f"Processing rows")
         # //"package;type;overrides;name;signature;ext;spec;kind"
-        generatedJson = join(Generator.TEMP_PATH, "out.json")
-        output_std = join(Generator.TEMP_PATH, "rows.txt")
+        output_std = join(self.temppath, "rows.txt")
+
+        decode = [
+            "bqrs",
+            "decode",
+            "--format",
+            "csv",
+            "--no-titles",
+            "--result-set",
+            "#select",
+        ]
 
         with open(output_std, "wb") as std:
-            self.codeql(
+            if not Generator.PAGE_SIZE:
+                pages = [decode]
+            else:
+                pages = [
+                    decode
+                    + ["--start-at", str(offset), "--rows", str(Generator.PAGE_SIZE)]
+                    for offset in self.pageOffsets(bqrsFile, Generator.PAGE_SIZE)
+                ]
+
+            for page in pages:
+                for tup in csv.reader(self.codeql.lines(*page, bqrsFile, stderr=std)):
+                    yield from tup
+
+    def pageOffsets(self, bqrsFile: str, page_size: int) -> List[int]:
+        """Byte offsets of each page of `page_size` rows in the BQRS file"""
+        info = "".join(
+            self.codeql.lines(
                 "bqrs",
-                "decode",
+                "info",
                 "--format",
                 "json",
-                "--output",
-                generatedJson,
+                "--paginate-rows",
+                str(page_size),
+                "--paginate-result-set",
+                "#select",
                 bqrsFile,
-                outconsumer=print_to_stream(std),
             )
+        )
 
-        logger.debug(f"writing json output to: {generatedJson}")
-        with open(generatedJson) as f:
-            results = json.load(f)
-
-        try:
-            results["#select"]["tuples"]
-        except KeyError:
-            raise Exception("Unexpected JSON output - no tuples found")
-
-        rows = []
-        for tup in results["#select"]["tuples"]:
-            rows.extend(tup)
-
-        logger.debug(f"Final Row Summary count: {len(rows)}")
+        for result_set in json.loads(info).get("resultSets", []):
+            if result_set.get("name") == "#select":
+                return result_set.get("pagination", {}).get("offsets", [])
 
-        return rows
+        raise Exception("Unexpected BQRS info output - no #select result set")
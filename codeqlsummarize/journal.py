@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import *
+
+from codeqlsummarize.models import CodeQLDatabase
+from codeqlsummarize.utils import atomicWrite
+
+logger = logging.getLogger("codeqlsummarize.journal")
+
+
+class Journal:
+    """Append-only record of the work completed for each database in a run.
+
+    Every stage a database completes (download, extraction, export) is
+    appended with the inputs it used. A run that didn't complete can be
+    resumed: work whose recorded inputs still match is skipped. Decoded
+    query results are reused through the result cache instead.
+    """
+
+    STARTED = "run-started"
+    COMPLETED = "run-completed"
+
+    def __init__(self, path: str, inputs: Dict[str, Any], resume: bool = False):
+        self.path = path
+        self.inputs = inputs
+
+        # Latest inputs of each stage of each database, from the resumed run
+        self.entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        self.run = self._resumable() if resume else None
+        started = self.run is None
+        if started:
+            if resume:
+                logger.info("No unfinished run to resume, starting a new run")
+            self.run = uuid.uuid4().hex
+            # Only the current run is kept
+            with atomicWrite(self.path) as handle:
+                handle.write("")
+        else:
+            logger.info(
+                f"Resuming run {self.run} ({len(self.entries)} completed stages)"
+            )
+
+        self._handle: Optional[TextIO] = open(self.path, "a")
+        if not started and self._handle.tell() and not self._endsWithNewline():
+            # Don't append to the partial last line of an interrupted run
+            self._handle.write("\n")
+        if started:
+            self._append({"stage": Journal.STARTED, "inputs": self.inputs})
+
+    def _endsWithNewline(self) -> bool:
+        with open(self.path, "rb") as handle:
+            handle.seek(-1, os.SEEK_END)
+            return handle.read(1) == b"\n"
+
+    def _load(self) -> List[dict]:
+        entries = []
+        try:
+            with open(self.path, "r") as handle:
+                for line in handle:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # The last line of an interrupted run can be partial
+                        logger.debug(f"Ignoring invalid journal entry: {line!r}")
+        except OSError:
+            pass
+        return entries
+
+    def _resumable(self) -> Optional[str]:
+        """The unfinished run with the same inputs, loading its entries"""
+        entries = self._load()
+        started = [e for e in entries if e.get("stage") == Journal.STARTED]
+        if not started:
+            return None
+
+        run = started[-1].get("run")
+        if any(
+            e.get("run") == run and e.get("stage") == Journal.COMPLETED for e in entries
+        ):
+            logger.debug(f"Last run {run} completed")
+            return None
+        if started[-1].get("inputs") != self.inputs:
+            logger.warning("Last run used different options, it can't be resumed")
+            return None
+
+        for entry in entries:
+            if entry.get("run") == run and entry.get("database"):
+                key = (entry["database"], entry["stage"])
+                self.entries[key] = entry.get("inputs", {})
+        return run
+
+    def _append(self, entry: Dict[str, Any]):
+        line = json.dumps(dict(entry, run=self.run, time=time.time()), sort_keys=True)
+        with self._lock:
+            if not self._handle:
+                raise Exception("Journal is closed")
+            self._handle.write(line + "\n")
+            # Survives the process being killed right after
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+    @staticmethod
+    def key(database: CodeQLDatabase) -> str:
+        return f"{database.repository or database.path}:{database.language}"
+
+    def record(self, database: CodeQLDatabase, stage: str, **inputs):
+        """Record that a stage of a database completed with these inputs"""
+        key = Journal.key(database)
+        with self._lock:
+            self.entries[(key, stage)] = inputs
+        self._append({"database": key, "stage": stage, "inputs": inputs})
+
+    def done(self, database: CodeQLDatabase, stage: str, **inputs) -> bool:
+        """The stage of the database completed with the same inputs"""
+        with self._lock:
+            recorded = self.entries.get((Journal.key(database), stage))
+        return recorded is not None and recorded == inputs
+
+    def get(self, database: CodeQLDatabase, stage: str) -> Optional[Dict[str, Any]]:
+        """The inputs the stage of the database completed with"""
+        with self._lock:
+            return self.entries.get((Journal.key(database), stage))
+
+    def has(self, database: CodeQLDatabase, stage: str) -> bool:
+        """The stage of the database completed (with any inputs)"""
+        with self._lock:
+            return (Journal.key(database), stage) in self.entries
+
+    def complete(self):
+        """Mark the run as completed, it won't be resumed"""
+        self._append({"stage": Journal.COMPLETED})
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
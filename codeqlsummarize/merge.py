@@ -0,0 +1,173 @@
+"""Merge the outputs of sharded runs (`--shard i/n`) without re-running
+any queries:
+
+    python -m codeqlsummarize.merge -f extensions -o ./out ./shard-1 ./shard-2
+"""
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import logging
+from typing import *
+from argparse import ArgumentParser
+
+sys.path.append(".")
+
+from codeqlsummarize.exporters.customizations import writeBundleMetadata
+from codeqlsummarize.exporters.extensions import findCodeQLPack, indexCodeQLPacks
+from codeqlsummarize.models import Summaries
+from codeqlsummarize.utils import atomicWrite
+
+logger = logging.getLogger("codeqlsummarize.merge")
+
+
+parser = ArgumentParser(
+    "codeql-summarize-merge", "Merge sharded CodeQL Summarize outputs"
+)
+parser.add_argument(
+    "--debug", action="store_true", default=bool(os.environ.get("DEBUG"))
+)
+parser.add_argument(
+    "-f",
+    "--format",
+    default="extensions",
+    help="Format of the shard outputs (`json`, `json-lines`, `extensions`, `bundle`)",
+)
+parser.add_argument(
+    "-o", "--output", required=True, help="Merged output directory / file"
+)
+parser.add_argument(
+    "inputs", nargs="+", help="Output directories / files of the shards"
+)
+
+
+def openOutput(path: str):
+    """Open a (possibly gzip compressed) output of a shard"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r")
+
+
+def mergeJson(inputs: List[str], output: str):
+    """Union of the rows of each model"""
+    models: Dict[str, Set[str]] = {}
+    for path in inputs:
+        with openOutput(path) as handle:
+            for model, rows in json.load(handle).items():
+                models.setdefault(model, set()).update(rows)
+
+    # Same layout and row order as `exportToJson`
+    merged = {
+        model: [str(row) for row in Summaries(rows).rows]
+        for model, rows in models.items()
+    }
+    with atomicWrite(output, compress=output.endswith(".gz")) as handle:
+        json.dump(merged, handle, indent=2, sort_keys=True)
+
+
+def mergeJsonLines(inputs: List[str], output: str):
+    """Concatenate the models of each shard"""
+    with atomicWrite(output, compress=output.endswith(".gz")) as handle:
+        for path in inputs:
+            with openOutput(path) as source:
+                shutil.copyfileobj(source, handle, 1024 * 1024)
+
+
+def copyFiles(source: str, destination: str, ignore: Tuple[str, ...] = ()):
+    """Copy the files under `source` into `destination`, replacing them"""
+    for root, _, files in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            if name in ignore:
+                continue
+            if os.path.exists(os.path.join(target, name)):
+                logger.debug(f"Replacing {name} in {target}")
+            shutil.copyfile(os.path.join(root, name), os.path.join(target, name))
+
+
+def mergeExtensions(inputs: List[str], output: str):
+    """Copy the generated data extensions of each shard into the packs of the
+    output, which are copied from the first shard having them if needed"""
+    for shard in inputs:
+        for language, pack in indexCodeQLPacks(shard).items():
+            try:
+                target = findCodeQLPack(output, language)
+            except Exception:
+                # A pack at the root of the shard is created in the output
+                # directory itself, which exists
+                target = os.path.join(output, os.path.relpath(pack, shard))
+                logger.info(f"Creating {language} pack from {shard} :: {target}")
+                shutil.copytree(
+                    pack,
+                    target,
+                    ignore=shutil.ignore_patterns("generated"),
+                    dirs_exist_ok=True,
+                )
+
+            generated = os.path.join(pack, "generated")
+            if os.path.exists(generated):
+                logger.info(f"Merging data extensions :: {generated}")
+                copyFiles(generated, os.path.join(target, "generated"))
+
+
+def mergeBundle(inputs: List[str], output: str):
+    """Copy the generated libraries of each shard's bundle packs into the
+    output and regenerate each pack's `Customizations.qll`"""
+    for shard in inputs:
+        for name in sorted(os.listdir(shard)):
+            pack = os.path.join(shard, name)
+            if not name.endswith("-summarize") or not os.path.exists(
+                os.path.join(pack, "qlpack.yml")
+            ):
+                continue
+
+            logger.info(f"Merging bundle :: {pack}")
+            copyFiles(pack, os.path.join(output, name), ignore=("Customizations.qll",))
+
+    for name in sorted(os.listdir(output)):
+        root = os.path.join(output, name)
+        if not name.endswith("-summarize") or not os.path.isdir(root):
+            continue
+        language = name[: -len("-summarize")]
+
+        # Generated libraries are in `<owner>/<language>_summarize`
+        for owner in sorted(os.listdir(root)):
+            sub = os.path.join(root, owner, f"{language}_summarize")
+            if os.path.isdir(sub):
+                writeBundleMetadata(root, sub, language, owner)
+
+
+MERGERS: Dict[str, Callable[[List[str], str], None]] = {
+    "json": mergeJson,
+    "json-lines": mergeJsonLines,
+    "extensions": mergeExtensions,
+    "bundle": mergeBundle,
+}
+
+
+def main(arguments):
+    logging.basicConfig(
+        level=logging.DEBUG if arguments.debug else logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    merger = MERGERS.get(arguments.format)
+    if not merger:
+        raise Exception(f"Format can't be merged: {arguments.format}")
+
+    for path in arguments.inputs:
+        if not os.path.exists(path):
+            raise Exception(f"Shard output does not exist: {path}")
+
+    if arguments.format in ["extensions", "bundle"]:
+        os.makedirs(arguments.output, exist_ok=True)
+
+    logger.info(f"Merging {len(arguments.inputs)} shard outputs :: {arguments.output}")
+    merger(arguments.inputs, arguments.output)
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
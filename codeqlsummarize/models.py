@@ -1,22 +1,134 @@
 import os
+import sys
+import json
+import time
+import hashlib
 import zipfile
 import logging
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import *
+from urllib.error import HTTPError
 from dataclasses import *
 
-from codeqlsummarize.utils import request
-
+from codeqlsummarize.trace import count, span
+from codeqlsummarize.utils import request, loadMetadata, saveMetadata, metadataPath
 
 CODEQL_LANGUAGES = ["java", "csharp"]
 
+# Read buffer size used when downloading databases
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Records which archive an extracted database came from
+EXTRACTION_STAMP = ".codeqlsummarize.json"
+# Database members the model generator queries don't use
+EXTRACTION_SKIP = ["src.zip", "log/", "diagnostic/", "results/"]
+
 logger = logging.getLogger("codeqlsummarize.models")
 
 
-@dataclass
+class ModelRow(tuple):
+    """A Models as Data row (`package;type;subtypes;name;signature;ext;...`)
+    as a tuple of its columns.
+
+    Columns that repeat across rows (package, type, kind, ...) are interned
+    so all the rows share a single copy of them.
+    """
+
+    __slots__ = ()
+
+    SEPARATOR: ClassVar[str] = ";"
+    # Columns which are mostly unique per row and not worth interning
+    UNIQUE_COLUMNS: ClassVar[Tuple[int, ...]] = (3, 4)
+
+    @classmethod
+    def parse(cls, row: str) -> "ModelRow":
+        columns = row.split(cls.SEPARATOR)
+        return tuple.__new__(
+            cls,
+            [
+                column if index in cls.UNIQUE_COLUMNS else sys.intern(column)
+                for index, column in enumerate(columns)
+            ],
+        )
+
+    @property
+    def package(self) -> str:
+        return self[0]
+
+    @property
+    def type(self) -> str:
+        return self[1]
+
+    @property
+    def kind(self) -> str:
+        return self[-2]
+
+    def __str__(self) -> str:
+        return ModelRow.SEPARATOR.join(self)
+
+
 class Summaries:
-    rows: List[str] = field(default_factory=list)
+    """Model rows of a query, sorted once so exporters can iterate as is.
+
+    Rows are parsed as they are added (e.g. straight from `bqrs decode`)
+    and stored as one list per column, so a row doesn't need a tuple of
+    its own until it is read back as a `ModelRow`.
+    """
+
+    def __init__(self, rows: Iterable[Union[str, Sequence[str]]] = ()):
+        # None where a row is shorter than the others
+        self.columns: List[List[Optional[str]]] = []
+        self.count = 0
+
+        for row in rows:
+            values = ModelRow.parse(row) if isinstance(row, str) else row
+            if len(values) == len(self.columns):
+                for column, value in zip(self.columns, values):
+                    column.append(value)
+            else:
+                while len(self.columns) < len(values):
+                    self.columns.append([None] * self.count)
+                for index, column in enumerate(self.columns):
+                    column.append(values[index] if index < len(values) else None)
+            self.count += 1
+
+        self._sort()
+
+    def _sort(self):
+        """Sort the rows as tuples of their columns (shorter rows first)"""
+        order = list(range(self.count))
+        # Least significant column first, each sort keeps the previous order
+        for column in reversed(self.columns):
+            if None in column:
+                keys = [(value is not None, value or "") for value in column]
+                order.sort(key=keys.__getitem__)
+            else:
+                order.sort(key=column.__getitem__)
+        self.columns = [[column[index] for index in order] for column in self.columns]
+
+    @property
+    def rows(self) -> Iterator[ModelRow]:
+        """The rows, in sorted order"""
+        for values in zip(*self.columns):
+            if None in values:
+                values = [value for value in values if value is not None]
+            yield tuple.__new__(ModelRow, values)
+
+    def __iter__(self) -> Iterator[ModelRow]:
+        return self.rows
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Summaries):
+            return NotImplemented
+        return self.columns == other.columns
+
+    def __repr__(self) -> str:
+        return f"Summaries(rows={self.count})"
 
 
 @dataclass
@@ -48,6 +160,9 @@ class CodeQLDatabase:
     repository: Optional[str] = None
     summaries: Dict[str, Summaries] = field(default_factory=dict)
 
+    # Downloaded (but not yet extracted) database archive
+    archive: Optional[str] = None
+
     def __post_init__(self):
         if self.path and not os.path.exists(self.path):
             raise Exception("Database folder incorrect")
@@ -58,6 +173,28 @@ class CodeQLDatabase:
     def exists(self) -> bool:
         return False if not self.path else os.path.exists(self.path)
 
+    def identity(self) -> Optional[str]:
+        """Identity of the database and its contents.
+
+        The database metadata records when and from which commit the
+        database was created, so it changes whenever the database does.
+        Databases of different repositories (or languages) can have the
+        same metadata, so those are part of the identity too.
+        """
+        if not self.path:
+            return None
+
+        metadata = os.path.join(self.path, "codeql-database.yml")
+        if not os.path.exists(metadata):
+            return None
+
+        digest = hashlib.sha256()
+        for part in [self.repository or self.name, self.language]:
+            digest.update(part.encode("utf-8") + b"\0")
+        with open(metadata, "rb") as handle:
+            digest.update(handle.read())
+        return digest.hexdigest()
+
     def display_name(self, owner: Optional[str] = None) -> str:
         if self.repository:
             r = self.repository.replace("-", " ")
@@ -90,7 +227,14 @@ class CodeQLDatabase:
     def downloadDatabase(
         self, github: GitHub, output: str, use_cache: bool = True
     ) -> str:
-        """Download CodeQL database"""
+        """Download and extract CodeQL database"""
+        archive = self.downloadArchive(github, output, use_cache=use_cache)
+        return self.extractArchive(archive, output)
+
+    def downloadArchive(
+        self, github: GitHub, output: str, use_cache: bool = True
+    ) -> str:
+        """Download CodeQL database archive"""
         url = f"{GitHub.endpoint}/repos/{self.repository}/code-scanning/codeql/databases/{self.language}"
         logger.debug(f"Endpoint to Download Database :: {url}")
 
@@ -109,6 +253,7 @@ class CodeQLDatabase:
 
         output_zip = os.path.join(output, self.database_folder + ".tar.gz")
         output_db = os.path.join(output, self.database_folder)
+        partial_zip = output_zip + ".part"
 
         # Deleting cached files
         if not use_cache:
@@ -116,32 +261,155 @@ class CodeQLDatabase:
             if os.path.exists(output_db):
                 shutil.rmtree(output_db)
 
-            if os.path.exists(output_zip):
-                os.remove(output_zip)
-
-        if not os.path.exists(output_zip):
-            logger.info("Downloading CodeQL Database from GitHub")
-
-            with request(
-                url,
-                headers=headers,
-                method="get",
-            ) as r:
-                with open(output_zip, "wb") as f:
-                    while True:
-                        chunk = r.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+            for path in [output_zip, partial_zip]:
+                for cached in [path, metadataPath(path)]:
+                    if os.path.exists(cached):
+                        os.remove(cached)
+
+        if os.path.exists(output_zip):
+            metadata = loadMetadata(output_zip)
+
+            if metadata is None:
+                logger.info("Database archive has no download metadata, downloading...")
+            elif not metadata.get("etag") and not metadata.get("last_modified"):
+                logger.info(
+                    "Database archive is present on system, skipping download..."
+                )
+                return output_zip
+            else:
+                # Only download the archive again if it changed
+                if metadata.get("etag"):
+                    headers["If-None-Match"] = metadata["etag"]
+                if metadata.get("last_modified"):
+                    headers["If-Modified-Since"] = metadata["last_modified"]
+
+        logger.info("Downloading CodeQL Database from GitHub")
+        try:
+            with span("download", "database", database=self.repository):
+                self._download(url, headers, output_zip)
+        except HTTPError as err:
+            if err.code != 304:
+                raise
+            err.close()
+            logger.info("Database archive is up to date, skipping download...")
+            count("download.not-modified")
+
+        return output_zip
+
+    def _download(self, url: str, headers: dict, output_zip: str):
+        """Download to a partial file, resuming it if possible, and move it
+        in place once complete"""
+        partial_zip = output_zip + ".part"
+        partial_metadata = loadMetadata(partial_zip)
+
+        offset = 0
+        conditional = "If-None-Match" in headers or "If-Modified-Since" in headers
+        if not conditional and partial_metadata and os.path.exists(partial_zip):
+            validator = partial_metadata.get("etag") or partial_metadata.get(
+                "last_modified"
+            )
+            offset = os.path.getsize(partial_zip)
+            if offset and validator:
+                logger.info(f"Resuming download from byte {offset}")
+                # The server sends the whole archive if it changed since
+                headers = dict(headers, Range=f"bytes={offset}-")
+                headers["If-Range"] = validator
+            else:
+                offset = 0
+
+        try:
+            response = request(url, headers=headers, method="get")
+        except HTTPError as err:
+            if err.code != 416 or not offset:
+                raise
+            err.close()
+            logger.info("Partial download is invalid, restarting download...")
+            os.remove(partial_zip)
+            headers = {
+                k: v for k, v in headers.items() if k not in ["Range", "If-Range"]
+            }
+            response = request(url, headers=headers, method="get")
+            offset = 0
+
+        with response as r:
+            if r.status != 206:
+                offset = 0
+
+            metadata = {
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+            # Recorded before downloading so an interrupted download can resume
+            saveMetadata(partial_zip, metadata)
+
+            size = 0
+            started = time.monotonic()
+            with open(partial_zip, "ab" if offset else "wb") as f:
+                while True:
+                    chunk = r.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+
+            elapsed = max(time.monotonic() - started, 1e-6)
+            logger.info(
+                f"Downloaded {size / 1048576:.1f} MiB in {elapsed:.1f}s "
+                f"({size / 1048576 / elapsed:.1f} MiB/s)"
+            )
+
+            # A dropped connection looks like the end of the response
+            expected = r.headers.get("Content-Length")
+            if expected and int(expected) != size:
+                raise Exception(
+                    f"Download incomplete ({size} of {expected} bytes), will resume"
+                )
+
+        os.replace(partial_zip, output_zip)
+        saveMetadata(output_zip, metadata)
+        os.remove(metadataPath(partial_zip))
+
+    def extractArchive(
+        self, archive: str, output: str, minimal: bool = False, threads: int = 1
+    ) -> str:
+        """Extract a downloaded CodeQL database archive.
 
+        An up-to-date extraction (per the stamp written after extracting) is
+        reused. With `minimal`, only the members the queries need are
+        extracted.
+        """
+        output_db = os.path.join(output, self.database_folder)
+        stamp_path = os.path.join(output_db, EXTRACTION_STAMP)
+
+        previous = loadStamp(stamp_path)
+        stamp = archiveStamp(archive, previous=previous)
+        stamp["minimal"] = minimal
+
+        if (
+            previous
+            and previous.get("sha256") == stamp["sha256"]
+            and (minimal or not previous.get("minimal"))
+        ):
+            logger.info("Database extraction is up to date, skipping extraction...")
+            count("extract.reused")
         else:
-            logger.info("Database archive is present on system, skipping download...")
+            if os.path.exists(output_db):
+                shutil.rmtree(output_db)
 
-        logger.info(f"Extracting archive data :: {output_zip}")
+            logger.info(f"Extracting archive data :: {archive}")
 
-        # SECURITY: Do we trust this DB?
-        with zipfile.ZipFile(output_zip) as zf:
-            zf.extractall(output_db)
+            # SECURITY: Do we trust this DB?
+            with zipfile.ZipFile(archive) as zf:
+                members = [
+                    m for m in zf.infolist() if not minimal or isRequiredMember(m)
+                ]
+            with span("extract", "database", database=self.repository):
+                extractMembers(archive, members, output_db, threads=threads)
+
+            # Written last so an interrupted extraction is never reused
+            with open(stamp_path, "w") as handle:
+                json.dump(stamp, handle)
 
         logger.info(f" >>> {output_db}")
         codeql_lang_path = os.path.join(output_db, self.language)
@@ -152,3 +420,82 @@ class CodeQLDatabase:
             codeql_dir = os.path.join(output_db, codeql_dir)
             if os.path.isdir(codeql_dir):
                 return codeql_dir
+
+
+def loadStamp(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def archiveStamp(archive: str, previous: Optional[dict] = None) -> dict:
+    """Identify an archive by its content hash.
+
+    The hash is reused from the previous stamp if the archive's size and
+    modification time haven't changed, so unchanged multi-GB archives
+    aren't re-read.
+    """
+    stat = os.stat(archive)
+    stamp = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    if (
+        previous
+        and previous.get("size") == stamp["size"]
+        and previous.get("mtime") == stamp["mtime"]
+    ):
+        stamp["sha256"] = previous.get("sha256")
+        return stamp
+
+    digest = hashlib.sha256()
+    with open(archive, "rb") as handle:
+        while True:
+            chunk = handle.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    stamp["sha256"] = digest.hexdigest()
+    return stamp
+
+
+def isRequiredMember(member: zipfile.ZipInfo) -> bool:
+    """Check if the queries need the archive member"""
+    # Members are stored under the database's top-level directory
+    parts = member.filename.split("/", 1)
+    if len(parts) < 2:
+        return True
+    return not any(parts[1].startswith(skip) for skip in EXTRACTION_SKIP)
+
+
+def extractMembers(
+    archive: str, members: List[zipfile.ZipInfo], output: str, threads: int = 1
+):
+    """Extract archive members, decompressing them in parallel threads"""
+    if threads <= 1:
+        with zipfile.ZipFile(archive) as zf:
+            for member in members:
+                zf.extract(member, output)
+        return
+
+    # Create the directories up front as concurrent `extract` calls race on
+    # creating shared parent directories
+    for member in members:
+        parts = [p for p in member.filename.split("/")[:-1] if p not in ["", ".", ".."]]
+        os.makedirs(os.path.join(output, *parts), exist_ok=True)
+
+    # Balance the threads by the uncompressed size of the members
+    batches: List[List[zipfile.ZipInfo]] = [[] for _ in range(threads)]
+    ordered = sorted(members, key=lambda m: m.file_size, reverse=True)
+    for index, member in enumerate(ordered):
+        batches[index % threads].append(member)
+
+    def extractBatch(batch: List[zipfile.ZipInfo]):
+        # Every thread needs its own handle on the archive
+        with zipfile.ZipFile(archive) as zf:
+            for member in batch:
+                zf.extract(member, output)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(extractBatch, batch) for batch in batches]:
+            future.result()
@@ -0,0 +1,119 @@
+import math
+import queue
+import logging
+import itertools
+import threading
+from typing import *
+
+logger = logging.getLogger("codeqlsummarize.pipeline")
+
+# Marks the end of the work for a stage worker
+_STOP = object()
+
+
+class Stage:
+    """A pipeline stage with its own worker pool and bounded input queue.
+
+    With `priority`, queued items with the highest priority are processed
+    first instead of in arrival order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        concurrency: int = 1,
+        queue_size: Optional[int] = None,
+        priority: Optional[Callable[[Any], float]] = None,
+    ):
+        if concurrency < 1:
+            raise Exception(f"Stage '{name}' concurrency must be positive")
+
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.priority = priority
+
+        maxsize = queue_size or concurrency * 2
+        self.queue: queue.Queue = (
+            queue.PriorityQueue(maxsize=maxsize) if priority else queue.Queue(maxsize)
+        )
+        # Keeps items with the same priority in arrival order
+        self._sequence = itertools.count()
+
+        self.workers: List[threading.Thread] = []
+
+    def put(self, item: Any):
+        if not self.priority:
+            self.queue.put(item)
+        elif item is _STOP:
+            # Only taken once all the work has been taken
+            self.queue.put((math.inf, next(self._sequence), item))
+        else:
+            self.queue.put((-self.priority(item), next(self._sequence), item))
+
+    def get(self) -> Any:
+        item = self.queue.get()
+        return item[2] if self.priority else item
+
+
+class Pipeline:
+    """Run items through a list of stages, each stage feeding the next.
+
+    Stages run at the same time so, for example, database N+1 can be
+    downloading while database N is being analyzed. The input queues are
+    bounded so a fast stage can't run too far ahead of a slow one.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise Exception("Pipeline requires at least one stage")
+        self.stages = stages
+        self.errors: List[BaseException] = []
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.get()
+            if item is _STOP:
+                return
+
+            try:
+                result = stage.func(item)
+            except Exception as err:
+                logger.error(f"Stage '{stage.name}' failed: {err}")
+                self.errors.append(err)
+                continue
+
+            # Stages can drop items by returning None
+            if following and result is not None:
+                following.put(result)
+
+    def run(self, items: Iterable[Any]):
+        """Feed all items through the pipeline and wait for it to drain"""
+        for index, stage in enumerate(self.stages):
+            for worker_id in range(stage.concurrency):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index,),
+                    name=f"codeqlsummarize-{stage.name}-{worker_id}",
+                    daemon=True,
+                )
+                thread.start()
+                stage.workers.append(thread)
+
+        for item in items:
+            self.stages[0].put(item)
+
+        # Shutdown each stage once everything upstream of it has finished
+        for stage in self.stages:
+            for _ in stage.workers:
+                stage.put(_STOP)
+            for thread in stage.workers:
+                thread.join()
+            logger.debug(f"Stage '{stage.name}' completed")
+
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,427 @@
+import io
+import os
+import time
+import atexit
+import signal
+import asyncio
+import logging
+import threading
+import subprocess
+import collections
+from typing import *
+from concurrent.futures import Future
+
+logger = logging.getLogger("codeqlsummarize.process")
+
+# Bytes of each output stream kept in memory, for error messages
+OUTPUT_LIMIT = 64 * 1024
+# Seconds a process gets to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 5.0
+# Seconds to wait for the output left in the pipes of a stopped process
+DRAIN_TIMEOUT = 1.0
+
+
+class OutputBuffer:
+    """Ring buffer keeping the last `limit` bytes of a process' output.
+
+    With `spill` all of the output is also written to that file, in large
+    buffered writes instead of a flush per line.
+    """
+
+    def __init__(
+        self, limit: Optional[int] = OUTPUT_LIMIT, spill: Optional[str] = None
+    ):
+        self.limit = limit
+        # Total bytes written
+        self.size = 0
+
+        self._chunks: Deque[bytes] = collections.deque()
+        self._held = 0
+        self._spill = open(spill, "wb", buffering=1024 * 1024) if spill else None
+
+    def write(self, data: bytes) -> int:
+        if not data:
+            return 0
+        self.size += len(data)
+        if self._spill:
+            self._spill.write(data)
+
+        self._chunks.append(bytes(data))
+        self._held += len(data)
+        # Drop whole chunks as long as `limit` bytes are still held
+        while (
+            self.limit is not None and self._held - len(self._chunks[0]) >= self.limit
+        ):
+            self._held -= len(self._chunks.popleft())
+        return len(data)
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self.getvalue())
+
+    def getvalue(self) -> bytes:
+        data = b"".join(self._chunks)
+        if self.limit is not None:
+            data = data[-self.limit :]
+        return data
+
+    def text(self) -> str:
+        return self.getvalue().decode("utf-8", errors="replace")
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class OutputStream(io.RawIOBase):
+    """Output of a running command, read by another thread as it arrives.
+
+    Reading the pipe pauses while `limit` bytes are waiting to be read, so
+    a slow reader doesn't make the output pile up in memory. `finish` is
+    called once the command is done.
+    """
+
+    def __init__(self, limit: int = 1024 * 1024):
+        self.limit = limit
+
+        self._chunks: Deque[bytes] = collections.deque()
+        self._held = 0
+        self._finished = False
+        self._condition = threading.Condition()
+        self._transport: Optional[asyncio.ReadTransport] = None
+        # Set on the event loop thread while reading is paused
+        self._paused: Optional[
+            Tuple[asyncio.AbstractEventLoop, asyncio.ReadTransport]
+        ] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def attach(self, transport: asyncio.ReadTransport):
+        """Pipe transport the output is read from, paused while it's full"""
+        self._transport = transport
+
+    def write(self, data: bytes) -> int:
+        with self._condition:
+            self._chunks.append(bytes(data))
+            self._held += len(data)
+            self._condition.notify()
+            transport = self._transport
+            if self._held >= self.limit and transport and not self._paused:
+                transport.pause_reading()
+                self._paused = (asyncio.get_running_loop(), transport)
+        return len(data)
+
+    def finish(self):
+        with self._condition:
+            self._finished = True
+            self._condition.notify()
+
+    def readinto(self, buffer) -> int:
+        with self._condition:
+            while not self._chunks and not self._finished:
+                self._condition.wait()
+            if not self._chunks:
+                return 0
+
+            chunk = self._chunks.popleft()
+            size = min(len(buffer), len(chunk))
+            buffer[:size] = chunk[:size]
+            if size < len(chunk):
+                self._chunks.appendleft(chunk[size:])
+            self._held -= size
+
+            if self._paused and self._held < self.limit // 2:
+                loop, transport = self._paused
+                self._paused = None
+                loop.call_soon_threadsafe(self._resume, transport)
+            return size
+
+    def _resume(self, transport: asyncio.ReadTransport):
+        if not transport.is_closing():
+            transport.resume_reading()
+
+
+class ProcessResult(NamedTuple):
+    returncode: int
+    # Wall time in seconds
+    wall: float
+    # `os.wait4` resource usage, if available
+    rusage: Optional[Any]
+    timed_out: bool
+
+
+class _SinkProtocol(asyncio.Protocol):
+    """Writes the data read from a pipe to a file-like sink"""
+
+    def __init__(self, sink: BinaryIO, done: asyncio.Future):
+        self.sink = sink
+        self.done = done
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        if isinstance(self.sink, OutputStream):
+            self.sink.attach(transport)
+
+    def data_received(self, data: bytes):
+        self.sink.write(data)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if not self.done.done():
+            self.done.set_result(None)
+
+
+class ProcessRunner:
+    """Runs child processes from a single event loop thread.
+
+    The output of every child is read by the event loop as it arrives, so
+    running many processes concurrently doesn't need threads per pipe. The
+    children are reaped with `os.wait4` once their pidfd (or a poll) reports
+    they exited, so the resources they used can be recorded.
+
+    Callers block on `run`, or `submit` several commands and wait on the
+    returned futures (reading the output of one as it arrives through an
+    `OutputStream`). Cancelling a future, or a command running out of time,
+    stops the command's whole process tree: every child is started in its
+    own process group (session) so the processes it spawns (e.g. the
+    evaluator JVM) are signalled with it.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Commands running on the event loop
+        self._running: Set[asyncio.Task] = set()
+        # Processes being stopped, their process group is killed once they exit
+        self._stopping: Set[int] = set()
+
+        atexit.register(self.shutdown)
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="codeql-processes", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(
+        self,
+        command: List[str],
+        stdout: BinaryIO,
+        stderr: Optional[BinaryIO] = None,
+        cwd: str = ".",
+        timeout: Optional[float] = None,
+    ) -> Future:
+        """Start a command, writing its output to the sinks (`stderr=None`
+        combines it with the standard output)"""
+        return asyncio.run_coroutine_threadsafe(
+            self._run(command, stdout, stderr, cwd, timeout), self._start()
+        )
+
+    def run(
+        self,
+        command: List[str],
+        stdout: BinaryIO,
+        stderr: Optional[BinaryIO] = None,
+        cwd: str = ".",
+        timeout: Optional[float] = None,
+    ) -> ProcessResult:
+        """Run a command and wait for it to complete"""
+        future = self.submit(command, stdout, stderr, cwd=cwd, timeout=timeout)
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. KeyboardInterrupt, don't leave the process running
+            future.cancel()
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop:
+            # e.g. after a KeyboardInterrupt, children in their own process
+            # group didn't get the signal
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancelAll(), loop).result(
+                    timeout=TERMINATE_GRACE + DRAIN_TIMEOUT + 1
+                )
+            except Exception as err:
+                logger.debug(f"Failed to stop running commands: {err}")
+            loop.call_soon_threadsafe(loop.stop)
+            if thread:
+                thread.join()
+            loop.close()
+
+    async def _cancelAll(self):
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def _run(
+        self,
+        command: List[str],
+        stdout: BinaryIO,
+        stderr: Optional[BinaryIO],
+        cwd: str,
+        timeout: Optional[float],
+    ) -> ProcessResult:
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if stderr is None else subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=os.name == "posix",
+        )
+        task = asyncio.current_task()
+        if task:
+            self._running.add(task)
+
+        readers = [asyncio.ensure_future(self._read(proc.stdout, stdout))]
+        if stderr is not None:
+            readers.append(asyncio.ensure_future(self._read(proc.stderr, stderr)))
+        waiter = asyncio.ensure_future(self._wait(proc))
+
+        timed_out = False
+        try:
+            done, _ = await asyncio.wait([waiter], timeout=timeout)
+            if not done:
+                logger.warning(
+                    f"Command timed out after {timeout}s :: {' '.join(command)}"
+                )
+                timed_out = True
+                await self._stop(proc, waiter)
+
+            returncode, rusage = waiter.result()
+            # Output written before the process exited is still in the pipes
+            await asyncio.wait(readers, timeout=DRAIN_TIMEOUT if timed_out else None)
+        except asyncio.CancelledError:
+            logger.debug(f"Command cancelled :: {' '.join(command)}")
+            await self._stop(proc, waiter)
+            raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+            self._running.discard(task)
+            self._stopping.discard(proc.pid)
+
+        return ProcessResult(returncode, time.monotonic() - started, rusage, timed_out)
+
+    async def _read(self, pipe: BinaryIO, sink: BinaryIO):
+        loop = asyncio.get_running_loop()
+        try:
+            if os.name != "posix":
+                # Windows pipes can't be watched by the event loop
+                while True:
+                    chunk = await loop.run_in_executor(None, pipe.read1, 65536)
+                    if not chunk:
+                        return
+                    sink.write(chunk)
+
+            done = loop.create_future()
+            transport, _ = await loop.connect_read_pipe(
+                lambda: _SinkProtocol(sink, done), pipe
+            )
+            try:
+                await done
+            finally:
+                transport.close()
+        finally:
+            pipe.close()
+
+    async def _wait(self, proc: subprocess.Popen) -> Tuple[int, Optional[Any]]:
+        """Wait for the process to exit and reap it"""
+        loop = asyncio.get_running_loop()
+        if not hasattr(os, "wait4"):
+            return await loop.run_in_executor(None, proc.wait), None
+
+        pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+            except OSError:
+                # Linux < 5.3
+                pidfd = None
+
+        try:
+            delay = 0.001
+            while True:
+                try:
+                    if self._exited(proc):
+                        if proc.pid in self._stopping:
+                            # Leftover children of a stopped process, its
+                            # group is still reserved by the unreaped process
+                            self._signal(
+                                proc, getattr(signal, "SIGKILL", signal.SIGTERM)
+                            )
+                        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                    else:
+                        pid = 0
+                except ChildProcessError:
+                    return proc.wait(), None
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    return proc.returncode, rusage
+
+                if pidfd is not None:
+                    exited = loop.create_future()
+                    loop.add_reader(
+                        pidfd, lambda: exited.done() or exited.set_result(None)
+                    )
+                    try:
+                        await exited
+                    finally:
+                        loop.remove_reader(pidfd)
+                else:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+
+    def _exited(self, proc: subprocess.Popen) -> bool:
+        """The process exited (without reaping it, if possible)"""
+        if not hasattr(os, "waitid"):
+            return True
+        flags = os.WEXITED | os.WNOHANG | os.WNOWAIT
+        return os.waitid(os.P_PID, proc.pid, flags) is not None
+
+    async def _stop(self, proc: subprocess.Popen, waiter: asyncio.Future):
+        """Terminate the process tree, killing it if it doesn't exit in time"""
+        self._stopping.add(proc.pid)
+        # `Popen.terminate()` would reap the process (losing its usage)
+        self._signal(proc, signal.SIGTERM)
+        done, _ = await asyncio.wait([waiter], timeout=TERMINATE_GRACE)
+        if not done:
+            self._signal(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+            await asyncio.wait([waiter])
+
+    def _signal(self, proc: subprocess.Popen, sig: int):
+        # Once reaped, the process id (and group) can be reused
+        if proc.returncode is not None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, sig)
+            else:
+                os.kill(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+# Shared by all the commands of a run
+PROCESSES = ProcessRunner()
@@ -0,0 +1,127 @@
+import os
+import logging
+import threading
+from typing import *
+from contextlib import contextmanager
+
+from codeqlsummarize.cache import entrySize
+
+logger = logging.getLogger("codeqlsummarize.scheduler")
+
+# Memory (MiB) every evaluation gets on top of its database based estimate
+RAM_BASE = 2048
+# MiB of RAM estimated for each MiB of database on disk
+RAM_PER_DATABASE_MIB = 2
+# Share of the machine's memory given to the evaluators, the rest is left
+# to codeql-summarize itself, decoding and the system
+RAM_FRACTION = 0.8
+
+
+class Allocation(NamedTuple):
+    threads: int
+    # MiB, None lets the CLI decide
+    ram: Optional[int]
+
+
+class Scheduler:
+    """Splits the available cores and memory between concurrent evaluations.
+
+    Every job gets an even share of the cores. Memory is sized from the
+    database size (but never less than an even share), so large databases
+    get more of it. A job waits until enough memory is free, unless nothing
+    else is running.
+    """
+
+    def __init__(
+        self,
+        jobs: int,
+        threads: Optional[int] = None,
+        ram: Optional[int] = None,
+    ):
+        self.jobs = max(jobs, 1)
+        self.threads = threads or availableThreads()
+        self.ram = ram or availableRam()
+
+        self.ram_used = 0
+        self.running = 0
+        self._sizes: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+        logger.info(
+            f"Scheduler :: {self.jobs} jobs sharing {self.threads} threads "
+            f"and {self.ram or 'unlimited'} MiB RAM"
+        )
+
+    def databaseSize(self, path: Optional[str]) -> int:
+        """Size of a database on disk (in bytes)"""
+        if not path:
+            return 0
+        with self._condition:
+            if path not in self._sizes:
+                self._sizes[path] = entrySize(path)
+            return self._sizes[path]
+
+    def request(self, path: Optional[str]) -> Allocation:
+        """Resources an evaluation of the database should get"""
+        threads = max(self.threads // self.jobs, 1)
+        if not self.ram:
+            return Allocation(threads, None)
+
+        estimate = RAM_BASE + RAM_PER_DATABASE_MIB * self.databaseSize(path) // 1048576
+        ram = min(max(self.ram // self.jobs, estimate), self.ram)
+        return Allocation(threads, ram)
+
+    @contextmanager
+    def allocate(self, path: Optional[str]):
+        """Wait for and hold the resources to evaluate queries on a database"""
+        allocation = self.request(path)
+        ram = allocation.ram or 0
+
+        with self._condition:
+            while self.running and self.ram_used + ram > (self.ram or 0):
+                logger.debug(f"Waiting for {ram} MiB RAM :: {path}")
+                self._condition.wait()
+            self.running += 1
+            self.ram_used += ram
+
+        logger.debug(f"Allocated {allocation} :: {path}")
+        try:
+            yield allocation
+        finally:
+            with self._condition:
+                self.running -= 1
+                self.ram_used -= ram
+                self._condition.notify_all()
+
+
+def availableThreads() -> int:
+    """Cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def availableRam() -> Optional[int]:
+    """Memory (MiB) the evaluators can use, respecting container limits"""
+    total = None
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    # cgroup v2 and v1 memory limits
+    for limit_path in [
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ]:
+        try:
+            with open(limit_path, "r") as handle:
+                limit = handle.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit() and (total is None or int(limit) < total):
+            total = int(limit)
+
+    if not total:
+        return None
+    return int(total * RAM_FRACTION) // 1048576
@@ -0,0 +1,86 @@
+import json
+import hashlib
+import logging
+from typing import *
+
+from codeqlsummarize.models import CodeQLDatabase
+
+logger = logging.getLogger("codeqlsummarize.shard")
+
+
+def parseShard(shard: str) -> Tuple[int, int]:
+    """Parse a `i/n` shard (1 based) into its index and the shard count"""
+    try:
+        index, count = (int(part) for part in shard.split("/", 1))
+    except ValueError:
+        raise Exception(f"Shard must be `<index>/<count>` (e.g. `1/4`): {shard}")
+    if count < 1 or not 1 <= index <= count:
+        raise Exception(f"Shard index must be between 1 and {count}: {shard}")
+    return index, count
+
+
+def shardKey(database: CodeQLDatabase) -> str:
+    return f"{database.repository or database.name}:{database.language}"
+
+
+def shardHash(database: CodeQLDatabase) -> int:
+    """Stable across processes and machines (unlike `hash()`)"""
+    digest = hashlib.sha256(shardKey(database).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def loadSizes(path: str) -> Dict[str, int]:
+    """Known database sizes, keyed by repository (or `repository:language`)"""
+    with open(path, "r") as handle:
+        return {key: int(size) for key, size in json.load(handle).items()}
+
+
+def databaseSize(database: CodeQLDatabase, sizes: Dict[str, int]) -> Optional[int]:
+    size = sizes.get(shardKey(database))
+    if size is None and database.repository:
+        size = sizes.get(database.repository)
+    return size
+
+
+def assignShards(
+    databases: List[CodeQLDatabase],
+    count: int,
+    sizes: Optional[Dict[str, int]] = None,
+) -> List[int]:
+    """Shard (0 based) of each database.
+
+    Databases are assigned by hash, so a database stays on the same shard
+    however the project list changes. With known sizes, those databases are
+    instead assigned largest first to the least loaded shard so the shards
+    take about as long. Both only depend on the inputs, so every node
+    computes the same assignment.
+    """
+    shards = [shardHash(database) % count for database in databases]
+    if not sizes:
+        return shards
+
+    sized = []
+    for index, database in enumerate(databases):
+        size = databaseSize(database, sizes)
+        if size is not None:
+            sized.append((size, shardHash(database), index))
+
+    loads = [0] * count
+    for size, _, index in sorted(sized, key=lambda s: (-s[0], s[1])):
+        shard = min(range(count), key=lambda s: (loads[s], s))
+        shards[index] = shard
+        loads[shard] += size
+
+    logger.debug(f"Shard loads of known sizes :: {loads}")
+    return shards
+
+
+def selectShard(
+    databases: List[CodeQLDatabase],
+    shard: str,
+    sizes: Optional[Dict[str, int]] = None,
+) -> List[CodeQLDatabase]:
+    """The databases of the `i/n` shard"""
+    index, count = parseShard(shard)
+    shards = assignShards(databases, count, sizes=sizes)
+    return [database for database, s in zip(databases, shards) if s == index - 1]
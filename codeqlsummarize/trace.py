@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import *
+from contextlib import contextmanager
+
+from codeqlsummarize.utils import atomicWrite
+
+logger = logging.getLogger("codeqlsummarize.trace")
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    start: int
+    duration: int
+    thread: int
+    args: Dict[str, Any]
+
+
+class Tracer:
+    """Records timed spans and counters for the stages of a run.
+
+    Spans are recorded per stage, database and query so a slow run can be
+    broken down after the fact, either as a summary table or as a Chrome
+    trace (`chrome://tracing` or https://ui.perfetto.dev).
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.counters: Dict[str, int] = {}
+        # Counter values over time, for the trace
+        self.samples: List[Tuple[int, str, int]] = []
+        self.threads: Dict[int, str] = {}
+
+        self.started = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self.counters = {}
+            self.samples = []
+            self.threads = {}
+            self.started = time.perf_counter_ns()
+
+    def _now(self) -> int:
+        return time.perf_counter_ns() - self.started
+
+    @contextmanager
+    def span(self, name: str, category: str = "codeqlsummarize", **args):
+        """Time the body of the `with` statement"""
+        start = self._now()
+        try:
+            yield
+        finally:
+            duration = self._now() - start
+            thread = threading.current_thread()
+            with self._lock:
+                self.threads[thread.ident or 0] = thread.name
+                self.spans.append(
+                    Span(name, category, start, duration, thread.ident or 0, args)
+                )
+
+    def count(self, name: str, value: int = 1):
+        """Increment a counter (e.g. cache hits)"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.samples.append((self._now(), name, self.counters[name]))
+
+    def chromeTrace(self) -> Dict[str, Any]:
+        """Trace in the Chrome trace-event format (timestamps in microseconds)"""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+
+        with self._lock:
+            for tid, thread in self.threads.items():
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": tid,
+                        "args": {"name": thread},
+                    }
+                )
+            for span in self.spans:
+                events.append(
+                    {
+                        "name": span.name,
+                        "cat": span.category,
+                        "ph": "X",
+                        "ts": span.start / 1000,
+                        "dur": span.duration / 1000,
+                        "pid": pid,
+                        "tid": span.thread,
+                        "args": span.args,
+                    }
+                )
+            for timestamp, name, value in self.samples:
+                events.append(
+                    {
+                        "name": name,
+                        "ph": "C",
+                        "ts": timestamp / 1000,
+                        "pid": pid,
+                        "args": {name: value},
+                    }
+                )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def writeChromeTrace(self, path: str):
+        logger.info(f"Writing trace file :: {path}")
+        with atomicWrite(path) as handle:
+            json.dump(self.chromeTrace(), handle, default=str)
+
+    def summary(self) -> List[str]:
+        """Summary table of the time spent in each span and the counters"""
+        stats: Dict[str, List[int]] = {}
+        with self._lock:
+            for span in self.spans:
+                stats.setdefault(span.name, []).append(span.duration)
+            counters = dict(self.counters)
+
+        lines = [f"{'Span':<20} {'Count':>6} {'Total':>10} {'Mean':>10} {'Max':>10}"]
+        for name, durations in sorted(
+            stats.items(), key=lambda item: sum(item[1]), reverse=True
+        ):
+            total = sum(durations) / 1e9
+            lines.append(
+                f"{name:<20} {len(durations):>6} {total:>9.2f}s "
+                f"{total / len(durations):>9.2f}s {max(durations) / 1e9:>9.2f}s"
+            )
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<20} {value:>6}")
+        return lines
+
+
+TRACER = Tracer()
+
+
+def span(name: str, category: str = "codeqlsummarize", **args):
+    """Time a stage with the global tracer"""
+    return TRACER.span(name, category, **args)
+
+
+def count(name: str, value: int = 1):
+    """Increment a counter of the global tracer"""
+    TRACER.count(name, value)
@@ -1,15 +1,10 @@
 import os
+import sys
 import logging
 from typing import *
-from urllib.request import (
-    Request,
-    HTTPRedirectHandler,
-    HTTPDefaultErrorHandler,
-    OpenerDirector,
-    HTTPSHandler,
-    HTTPErrorProcessor,
-    UnknownHandler,
-)
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
 import subprocess
 from subprocess import CalledProcessError
 import glob
@@ -20,12 +15,163 @@ import threading
 import json
 import os
 import io
+import gzip
+import time
+import atexit
+import string
+import tempfile
+import selectors
+from contextlib import contextmanager
 
+from codeqlsummarize.process import PROCESSES, OutputBuffer, OutputStream
 
 logger = logging.getLogger("codeqlsummarize.utils")
 
 
-logger = logging.getLogger("codeqlsummarize.utils")
+class HTTPClient:
+    """HTTP client that keeps connections alive and reuses them per host"""
+
+    MAX_REDIRECTS = 10
+
+    def __init__(self):
+        self._idle: Dict[Tuple[str, str, int], List[HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _connection(self, key: Tuple[str, str, int]) -> Tuple[HTTPConnection, bool]:
+        """Get an idle connection to the host or open a new one"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = key
+        if scheme == "https":
+            return HTTPSConnection(host, port), False
+        elif scheme == "http":
+            return HTTPConnection(host, port), False
+        raise Exception(f"Unsupported URL scheme: {scheme}")
+
+    def _release(self, key: Tuple[str, str, int], connection: HTTPConnection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _send(
+        self, url: str, method: str, headers: dict, data: Optional[bytes]
+    ) -> "PooledResponse":
+        parts = urlsplit(url)
+        key = (
+            parts.scheme,
+            parts.hostname or "",
+            parts.port or (443 if parts.scheme == "https" else 80),
+        )
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        while True:
+            connection, reused = self._connection(key)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                return PooledResponse(self, key, connection, response, url)
+            except (HTTPException, ConnectionError) as err:
+                connection.close()
+                # The server might have closed an idle connection
+                if not reused:
+                    raise
+                logger.debug(f"Retrying request on a new connection: {err}")
+
+    def request(
+        self,
+        url: str,
+        method: str = "GET",
+        headers: dict = {},
+        data: Optional[bytes] = None,
+    ) -> "PooledResponse":
+        method = method.upper()
+        headers = dict(headers)
+
+        for _ in range(HTTPClient.MAX_REDIRECTS):
+            response = self._send(url, method, headers, data)
+
+            if response.status in [301, 302, 303, 307, 308]:
+                location = response.headers.get("Location")
+                response.read()
+                response.close()
+
+                redirect = urljoin(url, location)
+                # Credentials are only meant for the original host
+                if urlsplit(redirect).netloc != urlsplit(url).netloc:
+                    headers.pop("Authorization", None)
+                if response.status == 303 or (
+                    response.status in [301, 302] and method != "HEAD"
+                ):
+                    method, data = "GET", None
+
+                url = redirect
+                continue
+
+            if not 200 <= response.status < 300:
+                body = response.read()
+                response.close()
+                raise HTTPError(
+                    url,
+                    response.status,
+                    response.reason,
+                    response.headers,
+                    io.BytesIO(body),
+                )
+
+            return response
+
+        raise Exception(f"Too many redirects: {url}")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class PooledResponse:
+    """HTTP response that returns its connection to the pool once read"""
+
+    def __init__(self, client: HTTPClient, key, connection, response, url: str):
+        self.client = client
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self.response.read(amt)
+
+    def close(self):
+        if self.connection is None:
+            return
+
+        # The connection can only be reused if the response was fully read
+        if self.response.isclosed() and not self.response.will_close:
+            self.client._release(self.key, self.connection)
+        else:
+            self.response.close()
+            self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Shared by all requests so connections are reused across downloads
+HTTP_CLIENT = HTTPClient()
 
 
 def request(
@@ -34,24 +180,7 @@ def request(
     headers: dict = {},
     data: Optional[bytes] = None,
 ):
-    method = method.upper()
-
-    opener = OpenerDirector()
-    add = opener.add_handler
-    add(HTTPRedirectHandler())
-    add(HTTPSHandler())
-    add(HTTPDefaultErrorHandler())
-    add(HTTPErrorProcessor())
-    add(UnknownHandler())
-
-    req = Request(
-        url,
-        data=data,
-        headers=headers,
-        method=method,
-    )
-
-    return opener.open(req)
+    return HTTP_CLIENT.request(url, method=method, headers=headers, data=data)
 
 
 def loadYaml(path: str) -> Any:
@@ -67,6 +196,99 @@ def loadYaml(path: str) -> Any:
         return yaml.safe_load(handle)
 
 
+def formatStream(template: str, **fields) -> Iterator[str]:
+    """Lazily format a template.
+
+    Field values can be strings or iterables of strings, so large sections
+    are produced piece by piece instead of being built up front.
+    """
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if literal:
+            yield literal
+        if field is None:
+            continue
+
+        value = fields[field]
+        if isinstance(value, str):
+            yield value
+        else:
+            yield from value
+
+
+@contextmanager
+def atomicWrite(
+    path: str, mode: str = "w", buffering: int = 1024 * 1024, compress: bool = False
+):
+    """Open a file for writing that only replaces `path` once complete.
+
+    The data is written to a temporary file next to `path` and renamed
+    into place, so a crash never leaves a partially written file. With
+    `compress` the file is gzip compressed as it is written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        # Keep the permissions of the file being replaced
+        os.chmod(temp, os.stat(path).st_mode if os.path.exists(path) else 0o644)
+        if compress:
+            with open(fd, "wb", buffering=buffering) as raw, gzip.GzipFile(
+                fileobj=raw, mode="wb", compresslevel=6, mtime=0
+            ) as compressed:
+                if "b" in mode:
+                    yield compressed
+                else:
+                    with io.TextIOWrapper(compressed, encoding="utf-8") as handle:
+                        yield handle
+        else:
+            with open(fd, mode, buffering=buffering) as handle:
+                yield handle
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def parseSize(size: str) -> int:
+    """Parse a size in bytes with an optional K, M, G or T suffix"""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def parseDuration(duration: str) -> float:
+    """Parse a duration in seconds with an optional s, m or h suffix"""
+    units = {"S": 1, "M": 60, "H": 3600}
+    duration = duration.strip().upper()
+    if duration and duration[-1] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
+
+
+def metadataPath(path: str) -> str:
+    """Path of the metadata file stored next to a file"""
+    return path + ".json"
+
+
+def loadMetadata(path: str) -> Optional[dict]:
+    """Load the metadata stored next to a file"""
+    try:
+        with open(metadataPath(path), "r") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def saveMetadata(path: str, metadata: dict):
+    """Atomically save the metadata stored next to a file"""
+    with atomicWrite(metadataPath(path), buffering=-1) as handle:
+        json.dump(metadata, handle)
+
+
 def detectLanguage(
     database: str = "", project_repo: str = "", github=None
 ) -> List[str]:
@@ -86,21 +308,169 @@ def detectLanguage(
     return []
 
 
-def print_to_stream(f):
-    def impl(cmd, stream):
-        while True:
-            chunk = stream.readline()
-            if chunk == b"":
-                break
-            f.write(chunk)
-            f.flush()
-        stream.close()
+class ResourceUsage(NamedTuple):
+    """Resources used by a single CLI invocation"""
+
+    command: str
+    wall: float
+    user: Optional[float]
+    system: Optional[float]
+    # Peak resident set size in bytes
+    max_rss: Optional[int]
+    returncode: Optional[int]
+    labels: Dict[str, str]
+
+
+class ResourceProfiler:
+    """Records the wall time, CPU time and peak memory of CLI invocations.
+
+    Invocations are labeled with the database and query being processed by
+    the calling thread (see `label`), so usage can be aggregated per
+    database and per query.
+    """
+
+    def __init__(self):
+        self.usages: List[ResourceUsage] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def label(self, **labels: str):
+        """Label the invocations made by this thread in the `with` statement"""
+        previous = getattr(self._local, "labels", {})
+        self._local.labels = dict(previous, **labels)
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    def record(
+        self,
+        args: Sequence[str],
+        wall: float,
+        user: Optional[float] = None,
+        system: Optional[float] = None,
+        max_rss: Optional[int] = None,
+        returncode: Optional[int] = None,
+    ) -> ResourceUsage:
+        usage = ResourceUsage(
+            command=" ".join(a for a in args[:2] if not a.startswith("-")),
+            wall=wall,
+            user=user,
+            system=system,
+            max_rss=max_rss,
+            returncode=returncode,
+            labels=dict(getattr(self._local, "labels", {})),
+        )
+        with self._lock:
+            self.usages.append(usage)
 
-    return impl
+        logger.debug(
+            f"Resources :: codeql {usage.command} {usage.labels} - "
+            f"wall {wall:.2f}s, user {user or 0:.2f}s, system {system or 0:.2f}s, "
+            f"peak RSS {(max_rss or 0) / 1048576:.1f} MiB"
+        )
+        return usage
+
+    def recordRusage(
+        self, args: Sequence[str], wall: float, rusage, returncode: Optional[int]
+    ) -> ResourceUsage:
+        max_rss = None
+        if rusage is not None:
+            # Linux reports kilobytes, macOS bytes
+            max_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return self.record(
+            args,
+            wall,
+            user=rusage.ru_utime if rusage else None,
+            system=rusage.ru_stime if rusage else None,
+            max_rss=max_rss,
+            returncode=returncode,
+        )
 
+    def aggregate(self, *keys: str) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+        """Usage totals (and the largest peak RSS) grouped by labels"""
+        groups: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        with self._lock:
+            usages = list(self.usages)
+
+        for usage in usages:
+            group = tuple(usage.labels.get(key, "") for key in keys)
+            totals = groups.setdefault(
+                group,
+                {
+                    "invocations": 0,
+                    "wall": 0.0,
+                    "user": 0.0,
+                    "system": 0.0,
+                    "max_rss": 0,
+                },
+            )
+            totals["invocations"] += 1
+            totals["wall"] += usage.wall
+            totals["user"] += usage.user or 0.0
+            totals["system"] += usage.system or 0.0
+            totals["max_rss"] = max(totals["max_rss"], usage.max_rss or 0)
+        return groups
+
+    def summary(self) -> List[str]:
+        """Summary table of the usage per database"""
+        lines = [
+            f"{'Database':<30} {'Runs':>5} {'Wall':>9} {'CPU':>9} {'Peak RSS':>11}"
+        ]
+        for (database,), totals in sorted(self.aggregate("database").items()):
+            lines.append(
+                f"{database or '-':<30} {totals['invocations']:>5} "
+                f"{totals['wall']:>8.1f}s {totals['user'] + totals['system']:>8.1f}s "
+                f"{totals['max_rss'] / 1048576:>7.0f} MiB"
+            )
+        return lines
+
+    def report(self) -> Dict[str, Any]:
+        """Usage per invocation and aggregated per database and query"""
+        with self._lock:
+            usages = [usage._asdict() for usage in self.usages]
+
+        return {
+            "invocations": usages,
+            "databases": {
+                database: totals
+                for (database,), totals in self.aggregate("database").items()
+            },
+            "queries": [
+                dict(totals, database=database, query=query)
+                for (database, query), totals in self.aggregate(
+                    "database", "query"
+                ).items()
+                if query
+            ],
+        }
+
+    def writeReport(self, path: str):
+        logger.info(f"Writing resource report :: {path}")
+        with atomicWrite(path) as handle:
+            json.dump(self.report(), handle, indent=2, sort_keys=True)
+
+
+RESOURCES = ResourceProfiler()
+
+
+def procUsage(pid: int) -> Optional[Tuple[float, float, int]]:
+    """CPU time and peak RSS of a running process from `/proc` (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as handle:
+            # The command name can contain spaces, the fields follow it
+            fields = handle.read().rsplit(")", 1)[1].split()
+        peak = 0
+        with open(f"/proc/{pid}/status", "r") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        return None
 
-def close_stream(cmd, stream):
-    stream.close()
+    ticks = os.sysconf("SC_CLK_TCK")
+    return int(fields[11]) / ticks, int(fields[12]) / ticks, peak
 
 
 class Executable:
@@ -110,53 +480,354 @@ class Executable:
     def __call__(
         self,
         *args,
-        outconsumer=None,
-        errconsumer=None,
+        stdout=None,
+        stderr=None,
         combine_std_out_err=True,
-        inprovider=close_stream,
         cwd=".",
+        timeout: Optional[float] = None,
         **kwargs,
     ):
-        with open(os.devnull, "wb") as devnull:
-            outconsumer = outconsumer or print_to_stream(devnull)
-            errconsumer = errconsumer or print_to_stream(devnull)
+        """Run the command, writing its output to `stdout` / `stderr`
+        (binary file-like objects). Without them only the end of the
+        output is kept, for the error raised if the command fails.
+        """
+        command = [self.executable] + list(args)
+        commandstr = " ".join(command)
+
+        stdout = stdout if stdout is not None else OutputBuffer()
+        if combine_std_out_err:
+            stderr = None
+        elif stderr is None:
+            stderr = OutputBuffer()
+
+        result = PROCESSES.run(command, stdout, stderr, cwd=cwd, timeout=timeout)
+        RESOURCES.recordRusage(args, result.wall, result.rusage, result.returncode)
+
+        output = stdout.getvalue() if isinstance(stdout, OutputBuffer) else None
+        errors = stderr.getvalue() if isinstance(stderr, OutputBuffer) else None
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(
+                cmd=commandstr, timeout=timeout, output=output, stderr=errors
+            )
+        if result.returncode != 0:
+            raise CalledProcessError(
+                cmd=commandstr,
+                returncode=result.returncode,
+                output=output,
+                stderr=errors,
+            )
 
-            outpipe = subprocess.PIPE
-            errpipe = subprocess.PIPE
-            if combine_std_out_err:
-                errpipe = subprocess.STDOUT
-            inpipe = subprocess.PIPE
-            command = [self.executable] + list(args)
-
-            with subprocess.Popen(
-                command,
-                stdout=outpipe,
-                stderr=errpipe,
-                stdin=inpipe,
-                cwd=cwd,
-            ) as proc:
+    def lines(
+        self, *args, stderr=None, cwd=".", timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Run the command and yield its standard output line by line.
+
+        The output is read by the process runner as it arrives, and reading
+        pauses while the consumer is behind, so memory use doesn't depend
+        on how much the command prints. Stopping early stops the command.
+        """
+        command = [self.executable] + list(args)
+        commandstr = " ".join(command)
+
+        errors = stderr if stderr is not None else OutputBuffer()
+        stream = OutputStream()
+        future = PROCESSES.submit(command, stream, errors, cwd=cwd, timeout=timeout)
+        future.add_done_callback(lambda _: stream.finish())
+
+        # newline="" keeps embedded newlines for CSV parsing
+        text = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8", newline="")
+        try:
+            yield from text
+            result = future.result()
+        finally:
+            text.close()
+            # Stops the command if the consumer stopped reading early
+            future.cancel()
+
+        RESOURCES.recordRusage(args, result.wall, result.rusage, result.returncode)
+        errors = errors.getvalue() if isinstance(errors, OutputBuffer) else None
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(
+                cmd=commandstr, timeout=timeout, stderr=errors
+            )
+        if result.returncode != 0:
+            raise CalledProcessError(
+                cmd=commandstr, returncode=result.returncode, stderr=errors
+            )
 
-                commandstr = " ".join(command)
-                tout = threading.Thread(
-                    target=outconsumer, args=(commandstr, proc.stdout)
-                )
-                tout.start()
-                terr = None
-                if not combine_std_out_err:
-                    terr = threading.Thread(
-                        target=errconsumer, args=(commandstr, proc.stderr)
+
+class ServerUnavailable(Exception):
+    """The CodeQL CLI server exited before completing a command"""
+
+
+class _ChunkReader(io.RawIOBase):
+    """Raw stream over an iterator of bytes chunks"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, b"")
+            if not self.pending:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class _ServerProcess:
+    """A single `codeql execute cli-server` process.
+
+    Its standard error is read whenever the standard output is waited on, so
+    a command logging a lot doesn't block the server, and everything it
+    logged has been read once its output is complete.
+    """
+
+    def __init__(self, executable: str):
+        self.proc = subprocess.Popen(
+            [executable, "execute", "cli-server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.commands = 0
+
+        self._stderr = OutputBuffer()
+        self._selector = selectors.DefaultSelector()
+        for pipe in [self.proc.stdout, self.proc.stderr]:
+            os.set_blocking(pipe.fileno(), False)
+            self._selector.register(pipe.fileno(), selectors.EVENT_READ)
+
+    def _readStderr(self):
+        """Read what is available of the standard error"""
+        fd = self.proc.stderr.fileno()
+        if fd not in self._selector.get_map():
+            # Closed by the server
+            return
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                return
+            if not chunk:
+                self._selector.unregister(fd)
+                return
+            self._stderr.write(chunk)
+
+    def takeStderr(self) -> bytes:
+        data = self._stderr.getvalue()
+        self._stderr = OutputBuffer()
+        return data
+
+    def send(self, args: List[str]) -> Iterator[bytes]:
+        """Send a command and yield its output until the NUL terminator"""
+        try:
+            self.proc.stdin.write(json.dumps(args).encode("utf-8") + b"\0")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as err:
+            raise ServerUnavailable(str(err))
+
+        stdout = self.proc.stdout.fileno()
+        while True:
+            ready = [key.fd for key, _ in self._selector.select()]
+            if self.proc.stderr.fileno() in ready:
+                self._readStderr()
+            if stdout not in ready:
+                continue
+
+            try:
+                chunk = os.read(stdout, 65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise ServerUnavailable("CodeQL CLI server exited")
+            # Nothing is written after the terminator until the next command
+            if chunk.endswith(b"\0"):
+                self._readStderr()
+                yield chunk[:-1]
+                break
+            yield chunk
+
+        self.commands += 1
+
+    def close(self) -> Optional[int]:
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(json.dumps(["shutdown"]).encode("utf-8") + b"\0")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+        if self._selector.get_map() is not None:
+            self._readStderr()
+            self._selector.close()
+        return self.proc.returncode
+
+
+class CodeQLServer:
+    """Run CodeQL commands through long-lived `codeql execute cli-server`
+    processes so each command doesn't pay the JVM startup cost.
+
+    The server runs one command at a time, so every thread gets its own
+    server process. Whether the CLI has the server is checked once, with
+    `execute cli-server --help`. Commands that need a working directory or
+    have a timeout, or CLIs without the server, use the plain `Executable`.
+    """
+
+    ENABLED: ClassVar[bool] = False
+
+    _servers: ClassVar[Dict[str, "CodeQLServer"]] = {}
+    _servers_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, executable: Executable):
+        self.executable = executable
+
+        self._supported: Optional[bool] = None
+        self._local = threading.local()
+        self._processes: List[_ServerProcess] = []
+        self._lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def get(cls, executable: Executable) -> "CodeQLServer":
+        """Get the shared server for the executable"""
+        with cls._servers_lock:
+            server = cls._servers.get(executable.executable)
+            if not server:
+                server = cls(executable)
+                cls._servers[executable.executable] = server
+            return server
+
+    def supported(self) -> bool:
+        """Check (once) if the CLI has the `execute cli-server` command"""
+        with self._lock:
+            if self._supported is None:
+                if os.name != "posix":
+                    # The server's pipes can't be waited on together
+                    self._supported = False
+                else:
+                    try:
+                        self.executable("execute", "cli-server", "--help")
+                        self._supported = True
+                    except CalledProcessError:
+                        self._supported = False
+                if not self._supported:
+                    logger.warning(
+                        "CodeQL CLI server isn't supported, running commands directly..."
                     )
-                    terr.start()
-                tin = threading.Thread(target=inprovider, args=(commandstr, proc.stdin))
-                tin.start()
+            return self._supported
+
+    def _process(self) -> _ServerProcess:
+        process = getattr(self._local, "process", None)
+        if process is None or process.proc.poll() is not None:
+            logger.debug(f"Starting CodeQL CLI server :: {self.executable.executable}")
+            process = _ServerProcess(self.executable.executable)
+            self._local.process = process
+            with self._lock:
+                self._processes.append(process)
+        return process
+
+    def _run(self, args: List[str]) -> Iterator[bytes]:
+        process = self._process()
+        # The server runs many commands, so the CPU time of each is the
+        # difference between samples and the peak RSS is the server's
+        started = time.monotonic()
+        before = procUsage(process.proc.pid)
+        try:
+            yield from process.send(args)
+        except ServerUnavailable as err:
+            # Only this command failed, the next one starts a new server
+            logger.warning(f"CodeQL CLI server failed: {err}")
+            returncode = process.close()
+            self._local.process = None
+            RESOURCES.record(args, time.monotonic() - started, returncode=returncode)
+            raise CalledProcessError(
+                cmd=" ".join(["codeql"] + args),
+                returncode=returncode or 1,
+                stderr=process.takeStderr(),
+            )
 
-                ret = proc.wait()
-                tout.join()
-                tin.join()
-                if terr:
-                    terr.join()
-                if ret != 0:
-                    raise CalledProcessError(cmd=commandstr, returncode=ret)
+        after = procUsage(process.proc.pid)
+        RESOURCES.record(
+            args,
+            time.monotonic() - started,
+            user=after[0] - before[0] if before and after else None,
+            system=after[1] - before[1] if before and after else None,
+            max_rss=after[2] if after else None,
+            returncode=0,
+        )
+
+    def __call__(
+        self,
+        *args,
+        stdout=None,
+        stderr=None,
+        combine_std_out_err=True,
+        cwd=".",
+        **kwargs,
+    ):
+        # A command can only be stopped by stopping the whole server
+        if cwd != "." or kwargs.get("timeout") or not self.supported():
+            return self.executable(
+                *args,
+                stdout=stdout,
+                stderr=stderr,
+                combine_std_out_err=combine_std_out_err,
+                cwd=cwd,
+                **kwargs,
+            )
+
+        output = io.BytesIO()
+        for chunk in self._run(list(args)):
+            output.write(chunk)
+
+        errors = self._local.process.takeStderr()
+        if stdout is not None:
+            stdout.write(output.getvalue())
+            if combine_std_out_err:
+                stdout.write(errors)
+        if stderr is not None and not combine_std_out_err:
+            stderr.write(errors)
+
+    def lines(
+        self, *args, stderr=None, cwd=".", timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        if cwd != "." or timeout or not self.supported():
+            yield from self.executable.lines(
+                *args, stderr=stderr, cwd=cwd, timeout=timeout
+            )
+            return
+
+        chunks = self._run(list(args))
+        text = io.TextIOWrapper(
+            io.BufferedReader(_ChunkReader(chunks)), encoding="utf-8", newline=""
+        )
+        try:
+            yield from text
+        finally:
+            text.close()
+            # The server must be read up to the terminator before it can be
+            # given the next command, even if the consumer stopped early
+            for _ in chunks:
+                pass
+
+        if stderr is not None:
+            stderr.write(self._local.process.takeStderr())
+
+    def shutdown(self):
+        """Stop all server processes"""
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for process in processes:
+            process.close()
 
 
 def exec_from_path_env(execname):
@@ -177,7 +848,7 @@ def codeql_from_gh_codeql():
                 "--format",
                 "json",
                 combine_std_out_err=False,
-                outconsumer=print_to_stream(output),
+                stdout=output,
             )
             output.seek(0)
             return Executable(
@@ -214,10 +885,56 @@ def codeql_from_actions():
     return None
 
 
-def findCodeQLCli():
-    """Find CodeQL executable"""
-    return (
-        exec_from_path_env(codeql_exec_name())
-        or codeql_from_gh_codeql()
-        or codeql_from_actions()
-    )
+# Optional file caching the discovered CodeQL CLI across runs
+CODEQL_CLI_CACHE: Optional[str] = None
+CODEQL_CLI_CACHE_TTL = 24 * 60 * 60
+
+_codeql_cli: Optional[Executable] = None
+_codeql_cli_lock = threading.Lock()
+
+
+def codeql_from_cache():
+    """Find CodeQL using the on-disk discovery cache"""
+    if not CODEQL_CLI_CACHE:
+        return None
+
+    cached = loadMetadata(CODEQL_CLI_CACHE)
+    if not cached or time.time() - cached.get("time", 0) > CODEQL_CLI_CACHE_TTL:
+        return None
+
+    path = cached.get("path")
+    if not path or not os.access(path, os.X_OK):
+        return None
+
+    logger.debug(f"CodeQL found in discovery cache :: {path}")
+    return Executable(path)
+
+
+def findCodeQLCli() -> Optional[Union[Executable, CodeQLServer]]:
+    """Find CodeQL executable.
+
+    Discovery can shell out to `gh codeql`, so the result is reused for
+    the rest of the process (and on disk if `CODEQL_CLI_CACHE` is set).
+    """
+    global _codeql_cli
+
+    with _codeql_cli_lock:
+        if _codeql_cli is None:
+            _codeql_cli = codeql_from_cache()
+        if _codeql_cli is None:
+            _codeql_cli = (
+                exec_from_path_env(codeql_exec_name())
+                or codeql_from_gh_codeql()
+                or codeql_from_actions()
+            )
+            # Only a fresh discovery restarts the cache's time to live
+            if _codeql_cli and CODEQL_CLI_CACHE:
+                saveMetadata(
+                    CODEQL_CLI_CACHE,
+                    {"path": _codeql_cli.executable, "time": time.time()},
+                )
+        codeql = _codeql_cli
+
+    if codeql and CodeQLServer.ENABLED:
+        return CodeQLServer.get(codeql)
+    return codeql
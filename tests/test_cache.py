@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.cache import DatabaseCache, ResultCache
+from codeqlsummarize.models import Summaries
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.temp.name)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_key(self):
+        key = ResultCache.key("db", "codeql/java-queries", "1.0.0", "Sink.ql", "2.0")
+        self.assertEqual(
+            key, ResultCache.key("db", "codeql/java-queries", "1.0.0", "Sink.ql", "2.0")
+        )
+        self.assertNotEqual(
+            key, ResultCache.key("db", "codeql/java-queries", "1.0.1", "Sink.ql", "2.0")
+        )
+
+    def test_get_put(self):
+        key = ResultCache.key("db", "query")
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.put(key, Summaries(["a;b;c"]), database="db")
+        self.assertEqual([str(r) for r in self.cache.get(key)], ["a;b;c"])
+
+        self.cache.read = False
+        self.assertIsNone(self.cache.get(key))
+
+    def test_clear(self):
+        key = ResultCache.key("db", "query")
+        self.cache.put(key, Summaries(["a;b;c"]))
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get(key))
+
+
+class TestDatabaseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.cache = DatabaseCache(self.temp.name, max_bytes=3000)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def createArchive(self, name: str, size: int = 1000) -> str:
+        path = os.path.join(self.temp.name, name + ".tar.gz")
+        with open(path, "wb") as handle:
+            handle.write(b"0" * size)
+        return path
+
+    def createExtraction(self, name: str, size: int = 1000) -> str:
+        path = os.path.join(self.temp.name, name)
+        os.makedirs(os.path.join(path, "db-java"))
+        with open(os.path.join(path, "db-java", "data"), "wb") as handle:
+            handle.write(b"0" * size)
+        return path
+
+    def test_least_recently_used(self):
+        first = self.createArchive("first")
+        self.cache.update(first)
+        second = self.createExtraction("second")
+        self.cache.update(second)
+        third = self.createArchive("third")
+        self.cache.update(third)
+
+        # Using the first entry makes the second the least recently used
+        time.sleep(0.01)
+        self.cache.update(first)
+
+        self.cache.update(self.createArchive("fourth"))
+
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(third))
+        self.assertEqual(self.cache.size(), 3000)
+
+    def test_in_use(self):
+        first = self.createArchive("first")
+        self.cache.acquire(first)
+        self.cache.update(first)
+        self.cache.update(self.createArchive("second", size=2500))
+
+        self.assertTrue(os.path.exists(first))
+
+        self.cache.release(first)
+        self.cache.update(self.createArchive("third", size=10))
+        self.assertFalse(os.path.exists(first))
+
+    def test_in_use_other_process(self):
+        first = self.createArchive("first")
+        self.cache.update(first)
+
+        # Pinned by a running process (the parent of this process)
+        pin = os.path.join(self.temp.name, ".inuse", f"first.tar.gz.{os.getppid()}")
+        open(pin, "w").close()
+
+        self.cache.update(self.createArchive("second", size=2500))
+        self.assertTrue(os.path.exists(first))
+
+    def test_discover(self):
+        self.createArchive("first")
+        self.createExtraction("second")
+
+        cache = DatabaseCache(self.temp.name)
+        # Only extractions with a stamp are tracked
+        self.assertEqual(list(cache.entries.keys()), ["first.tar.gz"])
@@ -0,0 +1,180 @@
+import os
+import sys
+import gzip
+import json
+import tempfile
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.models import CodeQLDatabase, GitHub, Summaries
+from codeqlsummarize.exporters.customizations import (
+    exportBundle,
+    finalizeBundle,
+    saveQLL,
+)
+from codeqlsummarize.exporters.extensions import exportDataExtensions, findCodeQLPack
+from codeqlsummarize.exporters.exptjson import (
+    exportToJson,
+    exportToJsonLines,
+    finalizeJsonLines,
+)
+from codeqlsummarize.utils import atomicWrite
+
+ROWS = [
+    "com.example;Server;true;handle;(String);;Argument[0];sql;manual",
+    "com.example;Client;true;send;(String);;Argument[0];sql;manual",
+]
+
+
+class TestExporters(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.github = GitHub(owner="owner", token="token")
+
+        self.database = CodeQLDatabase("repo", "java", repository="owner/repo")
+        self.database.summaries = {
+            "SinkModel": Summaries(ROWS),
+            "SourceModel": Summaries([]),
+        }
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def read(self, path: str) -> str:
+        with open(path, "r") as handle:
+            return handle.read()
+
+    def test_json(self):
+        output = os.path.join(self.temp.name, "summaries.json")
+        exportToJson(self.database, output)
+
+        self.assertEqual(
+            self.read(output),
+            json.dumps(
+                {"SinkModel": sorted(ROWS), "SourceModel": []}, indent=2, sort_keys=True
+            ),
+        )
+
+    def test_json_lines(self):
+        output = os.path.join(self.temp.name, "summaries.jsonl.gz")
+
+        other = CodeQLDatabase("other", "java", repository="owner/other")
+        other.summaries = {"SinkModel": Summaries(ROWS[:1])}
+
+        exportToJsonLines(self.database, output)
+        exportToJsonLines(other, output)
+        finalizeJsonLines([self.database, other], output)
+
+        with gzip.open(output, "rt") as handle:
+            lines = [json.loads(line) for line in handle]
+
+        self.assertEqual(
+            [(line["repository"], line["row"]) for line in lines],
+            [
+                ("owner/repo", sorted(ROWS)[0]),
+                ("owner/repo", sorted(ROWS)[1]),
+                ("owner/other", ROWS[0]),
+            ],
+        )
+        self.assertEqual(lines[0]["model"], "SinkModel")
+        self.assertEqual(os.listdir(self.temp.name), ["summaries.jsonl.gz"])
+
+    def test_extensions(self):
+        with open(os.path.join(self.temp.name, "qlpack.yml"), "w") as handle:
+            handle.write(
+                "name: owner/java\nextensionTargets:\n  codeql/java-queries: '*'\n"
+            )
+
+        exportDataExtensions(self.database, self.temp.name, self.github)
+
+        data = self.read(os.path.join(self.temp.name, "generated", "owner", "repo.yml"))
+        self.assertEqual(
+            data,
+            """\
+extensions:
+  - addsTo:
+      pack: codeql/java-queries
+      extensible: sinkModel
+    data:
+      - ["com.example", "Client", true, "send", "(String)", "", "Argument[0]", "sql", "manual"]
+      - ["com.example", "Server", true, "handle", "(String)", "", "Argument[0]", "sql", "manual"]
+
+""",
+        )
+
+    def test_find_pack(self):
+        java = os.path.join(self.temp.name, "java")
+        python = os.path.join(self.temp.name, "java", "generated", "python")
+        os.makedirs(python)
+        with open(os.path.join(java, "qlpack.yml"), "w") as handle:
+            handle.write("extensionTargets:\n  codeql/java-queries: '*'\n")
+        with open(os.path.join(python, "qlpack.yml"), "w") as handle:
+            handle.write("extensionTargets:\n  codeql/python-queries: '*'\n")
+
+        self.assertEqual(findCodeQLPack(self.temp.name, "java"), java)
+        # Generated folders aren't searched
+        with self.assertRaises(Exception):
+            findCodeQLPack(self.temp.name, "python")
+
+        # Packs created after the index was built are found
+        csharp = os.path.join(self.temp.name, "csharp")
+        os.makedirs(csharp)
+        with open(os.path.join(csharp, "qlpack.yml"), "w") as handle:
+            handle.write("extensionTargets:\n  codeql/csharp-queries: '*'\n")
+        self.assertEqual(findCodeQLPack(self.temp.name, "csharp"), csharp)
+
+    def test_qll(self):
+        output = os.path.join(self.temp.name, "Customizations.qll")
+        saveQLL(self.database, output, self.github)
+
+        data = self.read(output)
+        self.assertIn("private class RepoSinkModelCustom extends SinkModelCsv {", data)
+        self.assertIn(
+            '      "com.example;Client;true;send;(String);;Argument[0];sql;manual",\n'
+            '      "com.example;Server;true;handle;(String);;Argument[0];sql;manual"\n',
+            data,
+        )
+        self.assertIn("// No SourceModel found", data)
+
+    def test_bundle(self):
+        root = os.path.join(self.temp.name, "java-summarize")
+        os.makedirs(root)
+        open(os.path.join(root, "qlpack.yml"), "w").close()
+
+        other = CodeQLDatabase("other", "java", repository="owner/other")
+        other.summaries = self.database.summaries
+
+        exportBundle(self.database, self.temp.name, self.github)
+        exportBundle(other, self.temp.name, self.github)
+
+        sub = os.path.join(root, "owner", "java_summarize")
+        # The aggregate file is only written by the finalizer
+        self.assertFalse(os.path.exists(os.path.join(sub, "Customizations.qll")))
+
+        finalizeBundle([self.database, other], self.temp.name, self.github)
+
+        data = self.read(os.path.join(sub, "Customizations.qll"))
+        self.assertIn(
+            "    private import owner.java_summarize.OtherGenerated\n"
+            "    private import owner.java_summarize.RepoGenerated\n",
+            data,
+        )
+        self.assertTrue(os.path.exists(os.path.join(root, "README.md")))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def test_failed_write(self):
+        with tempfile.TemporaryDirectory() as temp:
+            output = os.path.join(temp, "output.yml")
+            with open(output, "w") as handle:
+                handle.write("original")
+
+            with self.assertRaises(ValueError):
+                with atomicWrite(output) as handle:
+                    handle.write("partial")
+                    raise ValueError("failed")
+
+            with open(output, "r") as handle:
+                self.assertEqual(handle.read(), "original")
+            self.assertEqual(os.listdir(temp), ["output.yml"])
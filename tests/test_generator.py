@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest import mock
+from subprocess import TimeoutExpired
+
+sys.path.append(".")
+
+from codeqlsummarize import utils
+from codeqlsummarize.cache import ResultCache
+from codeqlsummarize.generator import Generator, QUERIES
+from codeqlsummarize.trace import TRACER
+from codeqlsummarize.models import CodeQLDatabase
+from benchmarks.fixtures import STUB_CLI, createDatabase, resetState
+
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        os.environ["CODEQL_BENCH_ROWS"] = "50"
+
+        self.codeql_cli = utils._codeql_cli
+        utils._codeql_cli = utils.Executable(STUB_CLI)
+
+        Generator.TEMP_PATH = self.temp.name
+        Generator.COMPILATION_CACHE = os.path.join(self.temp.name, "compilation")
+        Generator._packs = {}
+        Generator._cli_version = None
+
+        self.database = CodeQLDatabase(
+            "repo", "java", path=createDatabase(os.path.join(self.temp.name, "repo"))
+        )
+
+    def tearDown(self):
+        resetState()
+        utils._codeql_cli = self.codeql_cli
+        os.environ.pop("CODEQL_BENCH_LATENCY", None)
+        self.temp.cleanup()
+
+    def compiled(self):
+        return sorted(
+            name
+            for name in os.listdir(Generator.COMPILATION_CACHE)
+            if name != "precompiled"
+        )
+
+    def test_run_queries(self):
+        generator = Generator(self.database)
+        queries = {
+            name: generator.getModelGeneratorQuery(name) for name in QUERIES.keys()
+        }
+
+        summaries = generator.runQueries(queries)
+
+        self.assertEqual(sorted(summaries.keys()), sorted(QUERIES.keys()))
+        self.assertEqual(len(summaries["SinkModel"]), 50)
+        # Queries are compiled into the shared compilation cache
+        self.assertEqual(len(self.compiled()), len(QUERIES))
+
+    def test_run_queries_batched(self):
+        generator = Generator(self.database)
+        queries = {
+            name: generator.getModelGeneratorQuery(name) for name in QUERIES.keys()
+        }
+        self.assertGreater(len(queries), 1)
+        codeql = generator.codeql = mock.Mock(wraps=generator.codeql)
+
+        with self.assertLogs("codeqlsummarize.generator", level="INFO") as logs:
+            summaries = generator.runQueries(queries)
+
+        # All the queries are evaluated by one `database run-queries`
+        evaluations = [
+            args
+            for args, _ in codeql.call_args_list
+            if args[:2] == ("database", "run-queries")
+        ]
+        self.assertEqual(len(evaluations), 1)
+        for query in queries.values():
+            self.assertIn(query, evaluations[0])
+        self.assertIn(f"Running {len(queries)} queries", "\n".join(logs.output))
+
+        # Then the results of each query are decoded
+        decoded = [
+            args[-1]
+            for args, _ in codeql.lines.call_args_list
+            if args[:2] == ("bqrs", "decode")
+        ]
+        self.assertEqual(
+            sorted(decoded), sorted(generator.resultPath(q) for q in queries.values())
+        )
+        self.assertEqual(sorted(summaries.keys()), sorted(queries.keys()))
+        self.assertTrue(all(len(summaries[name]) == 50 for name in queries))
+
+    def test_result_cache_identity(self):
+        Generator.CACHE = ResultCache(os.path.join(self.temp.name, "results"))
+        TRACER.reset()
+        # Databases of different repositories with the same metadata
+        databases = [
+            CodeQLDatabase(
+                "repo",
+                "java",
+                path=createDatabase(os.path.join(self.temp.name, owner, "repo")),
+                repository=f"{owner}/repo",
+            )
+            for owner in ["first", "second"]
+        ]
+
+        summaries = []
+        for database in databases:
+            generator = Generator(database)
+            query = generator.getModelGeneratorQuery("SinkModel")
+            summaries.append(generator.runQueries({"SinkModel": query})["SinkModel"])
+
+        self.assertEqual(TRACER.counters.get("result-cache.miss"), 2)
+        self.assertNotIn("result-cache.hit", TRACER.counters)
+        self.assertNotEqual(list(summaries[0]), list(summaries[1]))
+
+    def test_precompile(self):
+        Generator.precompile("java")
+        self.assertEqual(len(self.compiled()), len(QUERIES))
+
+        markers = os.listdir(os.path.join(Generator.COMPILATION_CACHE, "precompiled"))
+        self.assertEqual(markers, ["codeql_java-queries-1.0.0-2.99.0-bench"])
+
+        # Compiled once per pack version
+        for name in self.compiled():
+            os.remove(os.path.join(Generator.COMPILATION_CACHE, name))
+        Generator.precompile("java")
+        self.assertEqual(self.compiled(), [])
+
+    def test_query_timeout(self):
+        generator = Generator(self.database)
+        query = generator.getModelGeneratorQuery("SinkModel")
+
+        os.environ["CODEQL_BENCH_LATENCY"] = "30"
+        Generator.QUERY_TIMEOUT = 0.5
+        started = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            generator.runQuery(query)
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_database_timeout(self):
+        Generator.DATABASE_TIMEOUT = 60
+        generator = Generator(self.database)
+        self.assertLessEqual(generator.timeout(2), 60)
+
+        # Budget spent by previous evaluations
+        generator.deadline = time.monotonic() - 1
+        with self.assertRaises(TimeoutExpired):
+            generator.timeout()
+
+        Generator.QUERY_TIMEOUT = 10
+        generator.deadline = time.monotonic() + 60
+        self.assertEqual(generator.timeout(2), 20)
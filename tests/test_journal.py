@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.journal import Journal
+from codeqlsummarize.models import CodeQLDatabase
+
+INPUTS = {"format": "extensions", "output": "/out"}
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp.name, "journal.jsonl")
+        self.database = CodeQLDatabase("repo", "java", repository="owner/repo")
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_resume(self):
+        journal = Journal(self.path, INPUTS)
+        journal.record(self.database, "downloaded", etag='"1"', size=10)
+        journal.close()
+
+        journal = Journal(self.path, INPUTS, resume=True)
+        self.assertTrue(journal.done(self.database, "downloaded", etag='"1"', size=10))
+        # Inputs changed since
+        self.assertFalse(journal.done(self.database, "downloaded", etag='"2"', size=10))
+        self.assertFalse(journal.has(self.database, "exported"))
+        journal.close()
+
+    def test_completed(self):
+        journal = Journal(self.path, INPUTS)
+        journal.record(self.database, "exported", identity="abc")
+        journal.complete()
+
+        journal = Journal(self.path, INPUTS, resume=True)
+        self.assertFalse(journal.has(self.database, "exported"))
+        journal.close()
+
+    def test_different_inputs(self):
+        journal = Journal(self.path, INPUTS)
+        journal.record(self.database, "exported", identity="abc")
+        journal.close()
+
+        journal = Journal(self.path, dict(INPUTS, format="json"), resume=True)
+        self.assertFalse(journal.has(self.database, "exported"))
+        journal.close()
+
+    def test_without_resume(self):
+        journal = Journal(self.path, INPUTS)
+        journal.record(self.database, "exported", identity="abc")
+        journal.close()
+
+        journal = Journal(self.path, INPUTS)
+        self.assertFalse(journal.has(self.database, "exported"))
+        journal.close()
+
+    def test_partial_entry(self):
+        journal = Journal(self.path, INPUTS)
+        journal.record(self.database, "downloaded", size=10)
+        journal.close()
+        with open(self.path, "a") as handle:
+            handle.write('{"database": "owner/repo:java", "sta')
+
+        journal = Journal(self.path, INPUTS, resume=True)
+        journal.record(self.database, "exported", identity="abc")
+        journal.close()
+
+        journal = Journal(self.path, INPUTS, resume=True)
+        self.assertTrue(journal.has(self.database, "downloaded"))
+        self.assertTrue(journal.done(self.database, "exported", identity="abc"))
+        journal.close()
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(".")
+
+from codeqlsummarize import utils
+from codeqlsummarize.__main__ import downloadStage, main, parser
+from codeqlsummarize.exporters import FINALIZERS
+from codeqlsummarize.generator import Generator
+from codeqlsummarize.journal import Journal
+from codeqlsummarize.models import CodeQLDatabase, GitHub
+from benchmarks.fixtures import (
+    STUB_CLI,
+    DatabaseServer,
+    createArchive,
+    createDatabase,
+    resetState,
+)
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.environ = dict(os.environ)
+        self.addCleanup(os.environ.update, self.environ)
+        self.addCleanup(os.environ.clear)
+        self.addCleanup(resetState)
+
+        os.environ["CODEQL_BENCH_ROWS"] = "50"
+        os.environ["RUNNER_TEMP"] = os.path.join(self.temp.name, "runner")
+        self.database = createDatabase(os.path.join(self.temp.name, "repo"))
+        self.journal = os.path.join(self.temp.name, "journal.jsonl")
+
+    def run_main(self, format: str, output: str, *options: str):
+        resetState()
+        utils._codeql_cli = utils.Executable(STUB_CLI)
+        main(
+            parser.parse_args(
+                [
+                    "--disable-banner",
+                    "-db",
+                    self.database,
+                    "-l",
+                    "java",
+                    "-f",
+                    format,
+                    "-o",
+                    os.path.join(self.temp.name, output),
+                    "--journal",
+                    self.journal,
+                    *options,
+                ]
+            )
+        )
+
+    def completed(self) -> bool:
+        with open(self.journal, "r") as handle:
+            return any(
+                json.loads(line)["stage"] == Journal.COMPLETED for line in handle
+            )
+
+    def runs(self) -> set:
+        with open(self.journal, "r") as handle:
+            return {json.loads(line)["run"] for line in handle}
+
+    def test_completed(self):
+        self.run_main("json-lines", "summaries.jsonl")
+        self.assertTrue(self.completed())
+
+    def test_finalizer_failure(self):
+        finalizer = mock.Mock(side_effect=Exception("disk full"))
+        with mock.patch.dict(FINALIZERS, {"json-lines": finalizer}):
+            with self.assertRaises(Exception):
+                self.run_main("json-lines", "summaries.jsonl")
+
+        finalizer.assert_called_once()
+        # The output wasn't finalized, so the run can still be resumed
+        self.assertFalse(self.completed())
+
+    def test_resume_after_timeout(self):
+        os.environ["CODEQL_BENCH_LATENCY"] = "30"
+        self.run_main("json", "summaries.json", "--query-timeout", "0.5")
+        # The timed out database can still be retried
+        self.assertFalse(self.completed())
+        self.assertFalse(os.path.exists(os.path.join(self.temp.name, "summaries.json")))
+
+        # Resumed with a larger budget, the database is analyzed again
+        os.environ["CODEQL_BENCH_LATENCY"] = "0"
+        self.run_main("json", "summaries.json", "--resume", "--query-timeout", "60")
+        self.assertTrue(self.completed())
+        self.assertEqual(len(self.runs()), 1)
+        with open(os.path.join(self.temp.name, "summaries.json"), "r") as handle:
+            self.assertTrue(json.load(handle))
+
+    def test_concurrent_databases(self):
+        repositories = [f"owner/repo{i}" for i in range(3)]
+        projects = os.path.join(self.temp.name, "projects.json")
+        with open(projects, "w") as handle:
+            json.dump({"java": repositories}, handle)
+
+        server = DatabaseServer(createArchive(size=4096))
+        self.addCleanup(setattr, GitHub, "endpoint", GitHub.endpoint)
+        self.addCleanup(utils.HTTP_CLIENT.close)
+        GitHub.endpoint = server.endpoint
+
+        resetState()
+        utils._codeql_cli = utils.Executable(STUB_CLI)
+        output = os.path.join(self.temp.name, "summaries.jsonl")
+        with server:
+            main(
+                parser.parse_args(
+                    [
+                        "--disable-banner",
+                        "-i",
+                        projects,
+                        "-f",
+                        "json-lines",
+                        "-o",
+                        output,
+                        "-t",
+                        "token",
+                        "--journal",
+                        self.journal,
+                        "-j",
+                        "2",
+                    ]
+                )
+            )
+        self.assertTrue(self.completed())
+
+        # Every database was analyzed in its own scratch directory
+        scratch = os.path.join(
+            os.environ["RUNNER_TEMP"], "codeqlsummarize", "generator"
+        )
+        self.assertEqual(
+            sorted(os.listdir(scratch)),
+            sorted(f"{repo.replace('/', '_')}-java" for repo in repositories),
+        )
+
+        # The exports were written one at a time: every line is a whole
+        # record and the records of a database aren't interleaved
+        with open(output, "r") as handle:
+            records = [json.loads(line) for line in handle]
+        self.assertEqual(len(records), len(repositories) * 2 * 50)
+        order = [
+            record["repository"]
+            for index, record in enumerate(records)
+            if index == 0 or records[index - 1]["repository"] != record["repository"]
+        ]
+        self.assertEqual(sorted(order), repositories)
+
+    def test_download_without_archive(self):
+        database = CodeQLDatabase("repo", "java", repository="owner/repo")
+        journal = Journal(self.journal, {})
+        self.addCleanup(journal.close)
+        arguments = parser.parse_args(["--disable-banner"])
+
+        # The download didn't leave an archive behind
+        archive = os.path.join(self.temp.name, "missing.tar.gz")
+        patch = mock.patch.object(
+            CodeQLDatabase, "downloadArchive", return_value=archive
+        )
+        with patch, self.assertNoLogs("main", level="WARNING"):
+            downloadStage(
+                database,
+                arguments,
+                GitHub(token="token"),
+                self.temp.name,
+                journal=journal,
+            )
+
+        self.assertEqual(database.archive, archive)
+        self.assertFalse(journal.has(database, "downloaded"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import io
+import os
+import sys
+import zipfile
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(".")
+
+from codeqlsummarize.models import CodeQLDatabase, GitHub
+from codeqlsummarize.utils import HTTP_CLIENT
+
+
+def createArchive(content: bytes) -> bytes:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("java/codeql-database.yml", "primaryLanguage: java\n")
+        zf.writestr("java/content.txt", content)
+        zf.writestr("java/src.zip", b"source")
+        zf.writestr("java/log/database.log", b"log")
+        for i in range(20):
+            zf.writestr(f"java/db-java/default/pool/{i}/data", content * i)
+    return data.getvalue()
+
+
+class DatabaseHandler(BaseHTTPRequestHandler):
+    """Stand-in for the Code Scanning API and its storage host"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+
+        # The API redirects to the storage host
+        if self.path.startswith("/repos/"):
+            self.send_response(302)
+            self.send_header("Location", f"{server.storage}/storage/database.zip")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = f'"{server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = server.archive
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == etag:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+        else:
+            self.send_response(200)
+
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        if server.truncate:
+            # Simulate a dropped connection
+            self.wfile.write(body[start : start + server.truncate])
+            server.truncate = None
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+
+class TestDownloadDatabase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), DatabaseHandler)
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.storage = ""
+        self.server.version = 1
+        self.server.archive = createArchive(b"version 1" * 1000)
+        self.server.truncate = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.endpoint = GitHub.endpoint
+        GitHub.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        self.temp = tempfile.TemporaryDirectory()
+        self.github = GitHub(token="token")
+        self.database = CodeQLDatabase("repo", "java", repository="owner/repo")
+
+    def tearDown(self):
+        GitHub.endpoint = self.endpoint
+        HTTP_CLIENT.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp.cleanup()
+
+    def download(self, **kwargs) -> str:
+        return self.database.downloadArchive(self.github, self.temp.name, **kwargs)
+
+    def readArchive(self, path: str) -> bytes:
+        with open(path, "rb") as handle:
+            return handle.read()
+
+    def test_download(self):
+        archive = self.download()
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+
+        path = self.database.extractArchive(archive, self.temp.name)
+        self.assertTrue(os.path.exists(os.path.join(path, "codeql-database.yml")))
+
+    def test_not_modified(self):
+        archive = self.download()
+        self.server.requests.clear()
+
+        self.assertEqual(self.download(), archive)
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+
+        _, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("If-None-Match"), '"1"')
+
+    def test_keep_alive(self):
+        self.download()
+        self.download()
+        self.download()
+
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_redirect_authorization(self):
+        port = self.server.server_address[1]
+        self.server.storage = f"http://localhost:{port}"
+        self.download()
+
+        (_, api), (_, storage) = self.server.requests
+        self.assertEqual(api.get("Authorization"), "token token")
+        # Credentials aren't sent to the storage host
+        self.assertNotIn("Authorization", storage)
+
+    def test_modified(self):
+        archive = self.download()
+
+        self.server.version = 2
+        self.server.archive = createArchive(b"version 2" * 1000)
+
+        self.download()
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+
+    def test_resume(self):
+        self.server.truncate = 1024
+        with self.assertRaises(Exception):
+            self.download()
+
+        archive = os.path.join(self.temp.name, "owner_repo.tar.gz")
+        self.assertFalse(os.path.exists(archive))
+        self.assertEqual(os.path.getsize(archive + ".part"), 1024)
+
+        self.download()
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+        self.assertFalse(os.path.exists(archive + ".part"))
+
+        _, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("Range"), "bytes=1024-")
+
+    def test_resume_modified(self):
+        self.server.truncate = 1024
+        with self.assertRaises(Exception):
+            self.download()
+
+        self.server.version = 2
+        self.server.archive = createArchive(b"version 2" * 1000)
+
+        archive = self.download()
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+
+    def test_disable_cache(self):
+        archive = self.download()
+        self.server.requests.clear()
+
+        self.download(use_cache=False)
+        _, headers = self.server.requests[-1]
+        self.assertNotIn("If-None-Match", headers)
+        self.assertEqual(self.readArchive(archive), self.server.archive)
+
+
+class TestExtractDatabase(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.database = CodeQLDatabase("repo", "java", repository="owner/repo")
+
+        self.archive = os.path.join(self.temp.name, "owner_repo.tar.gz")
+        self.writeArchive(b"version 1")
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def writeArchive(self, content: bytes):
+        with open(self.archive, "wb") as handle:
+            handle.write(createArchive(content))
+
+    def readFile(self, *path: str) -> bytes:
+        with open(os.path.join(*path), "rb") as handle:
+            return handle.read()
+
+    def test_reuse_extraction(self):
+        path = self.database.extractArchive(self.archive, self.temp.name)
+        marker = os.path.join(path, "marker")
+        open(marker, "w").close()
+
+        self.database.extractArchive(self.archive, self.temp.name)
+        self.assertTrue(os.path.exists(marker))
+
+        self.writeArchive(b"version 2")
+        self.database.extractArchive(self.archive, self.temp.name)
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(self.readFile(path, "content.txt"), b"version 2")
+
+    def test_minimal(self):
+        path = self.database.extractArchive(self.archive, self.temp.name, minimal=True)
+
+        self.assertTrue(os.path.exists(os.path.join(path, "codeql-database.yml")))
+        self.assertTrue(os.path.exists(os.path.join(path, "db-java")))
+        self.assertFalse(os.path.exists(os.path.join(path, "src.zip")))
+        self.assertFalse(os.path.exists(os.path.join(path, "log")))
+
+        # A full extraction is required after a minimal one
+        self.database.extractArchive(self.archive, self.temp.name)
+        self.assertTrue(os.path.exists(os.path.join(path, "src.zip")))
+
+    def test_threads(self):
+        path = self.database.extractArchive(self.archive, self.temp.name, threads=4)
+
+        with zipfile.ZipFile(self.archive) as zf:
+            for name in zf.namelist():
+                self.assertEqual(
+                    self.readFile(self.temp.name, "owner_repo", name), zf.read(name)
+                )
@@ -0,0 +1,82 @@
+import sys
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.models import ModelRow, Summaries
+
+SINK = "com.example;Client;true;send;(String);;Argument[0];request-forgery;df-generated"
+
+
+class TestModelRow(unittest.TestCase):
+    def test_parse(self):
+        row = ModelRow.parse(SINK)
+
+        self.assertEqual(len(row), 9)
+        self.assertEqual(row.package, "com.example")
+        self.assertEqual(row.type, "Client")
+        self.assertEqual(row.kind, "request-forgery")
+        self.assertEqual(str(row), SINK)
+        self.assertEqual(f"{row}", SINK)
+
+    def test_interned(self):
+        first = ModelRow.parse(SINK)
+        second = ModelRow.parse("".join(SINK))
+
+        self.assertIs(first.package, second.package)
+        self.assertIs(first.kind, second.kind)
+
+
+class TestSummaries(unittest.TestCase):
+    def test_sorted(self):
+        summaries = Summaries(
+            [
+                "com.example;Server;true;send;(String);;Argument[0];sql;manual",
+                "com.example;Client;true;send;(String);;Argument[0];sql;manual",
+            ]
+        )
+
+        self.assertTrue(all(isinstance(row, ModelRow) for row in summaries.rows))
+        self.assertEqual([row.type for row in summaries.rows], ["Client", "Server"])
+
+    def test_parsed_rows(self):
+        row = ModelRow.parse(SINK)
+        summaries = Summaries([row])
+
+        self.assertEqual(list(summaries.rows), [row])
+        self.assertEqual(str(next(summaries.rows)), SINK)
+
+    def test_iterator(self):
+        rows = [SINK.replace("send", name) for name in ["post", "get", "send"]]
+        summaries = Summaries(iter(rows))
+
+        self.assertEqual(len(summaries), 3)
+        self.assertEqual([str(row) for row in summaries], sorted(rows))
+
+    def test_columns(self):
+        rows = [SINK.replace("send", f"send{i}") for i in range(300)]
+        summaries = Summaries(rows)
+
+        # Repeated values share a single string
+        package = summaries.columns[0]
+        self.assertEqual(len(package), 300)
+        self.assertTrue(all(value is package[0] for value in package))
+
+    def test_ragged_rows(self):
+        rows = [
+            SINK.replace("send", f"send{i % 50}").replace("Client", f"Client{i % 3}")
+            for i in range(200)
+        ] + ["com.example;Client"]
+        summaries = Summaries(rows)
+
+        self.assertEqual(len(summaries), 201)
+        self.assertEqual(
+            [str(row) for row in summaries],
+            sorted(rows, key=lambda row: row.split(";")),
+        )
+
+    def test_equal(self):
+        rows = [SINK.replace("send", name) for name in ["post", "get", "send"]]
+
+        self.assertEqual(Summaries(rows), Summaries(reversed(rows)))
+        self.assertNotEqual(Summaries(rows), Summaries(rows[:2]))
@@ -0,0 +1,85 @@
+import sys
+import time
+import threading
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages_in_order(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        pipeline = Pipeline(
+            [
+                Stage("double", lambda i: i * 2, concurrency=3),
+                Stage("increment", lambda i: i + 1, concurrency=2),
+                Stage("collect", collect),
+            ]
+        )
+        pipeline.run(range(20))
+
+        self.assertEqual(sorted(results), [i * 2 + 1 for i in range(20)])
+
+    def test_stages_overlap(self):
+        # The first stage can only finish once the last stage has started
+        started = threading.Event()
+
+        def first(item):
+            if item == 1:
+                self.assertTrue(started.wait(timeout=5))
+            return item
+
+        def last(item):
+            started.set()
+
+        Pipeline([Stage("first", first), Stage("last", last)]).run([0, 1])
+
+    def test_dropped_items(self):
+        results = []
+        pipeline = Pipeline(
+            [
+                Stage("filter", lambda i: i if i % 2 else None),
+                Stage("collect", results.append),
+            ]
+        )
+        pipeline.run(range(6))
+
+        self.assertEqual(sorted(results), [1, 3, 5])
+
+    def test_priority(self):
+        results = []
+        stage = None
+
+        def collect(item):
+            if not results:
+                # Let the other items queue up behind the first one
+                while stage.queue.qsize() < 5:
+                    time.sleep(0.01)
+            results.append(item)
+
+        stage = Stage("collect", collect, queue_size=10, priority=lambda i: i)
+        Pipeline([stage]).run([0, 1, 5, 3, 4, 2])
+
+        self.assertEqual(sorted(results), list(range(6)))
+        self.assertEqual(results[1:], sorted(results[1:], reverse=True))
+
+    def test_errors(self):
+        def fail(item):
+            if item == 2:
+                raise ValueError("failed")
+            return item
+
+        results = []
+        pipeline = Pipeline([Stage("fail", fail), Stage("collect", results.append)])
+
+        with self.assertRaises(ValueError):
+            pipeline.run(range(4))
+        self.assertEqual(sorted(results), [0, 1, 3])
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+import subprocess
+
+sys.path.append(".")
+
+from codeqlsummarize.process import PROCESSES, OutputBuffer, OutputStream
+from codeqlsummarize.utils import Executable
+
+CHATTY = "import sys\nfor i in range(5000): print(f'line {i}', flush=True)"
+
+# Starts a child that outlives it unless the whole process group is stopped
+SPAWNING = """
+import sys, time, subprocess
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+print(child.pid, flush=True)
+time.sleep(60)
+"""
+
+
+# Prints its own process id first
+SPAWNING_PIDS = SPAWNING.replace(
+    "print(child.pid", "import os\nprint(os.getpid(), child.pid"
+)
+
+
+def running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as handle:
+            # Zombies aren't running
+            return handle.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def exited(*pids: int, wait: float = 10) -> bool:
+    deadline = time.monotonic() + wait
+    while any(running(pid) for pid in pids) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not any(running(pid) for pid in pids)
+
+
+def waitOutput(buffer: OutputBuffer, wait: float = 10) -> bytes:
+    deadline = time.monotonic() + wait
+    while b"\n" not in buffer.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return buffer.getvalue()
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_ring(self):
+        buffer = OutputBuffer(limit=10)
+        for i in range(100):
+            buffer.write(f"{i:02}\n".encode())
+        self.assertEqual(buffer.getvalue(), b"\n97\n98\n99\n")
+        self.assertTrue(buffer.truncated)
+        self.assertEqual(buffer.size, 300)
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, "output.txt")
+            with OutputBuffer(limit=4, spill=path) as buffer:
+                buffer.write(b"hello ")
+                buffer.write(b"world")
+            with open(path, "rb") as handle:
+                self.assertEqual(handle.read(), b"hello world")
+            self.assertEqual(buffer.getvalue(), b"orld")
+
+
+class TestProcessRunner(unittest.TestCase):
+    def test_output(self):
+        buffer = OutputBuffer(limit=None)
+        errors = OutputBuffer()
+        result = PROCESSES.run(
+            [sys.executable, "-c", CHATTY + "\nprint('oops', file=sys.stderr)"],
+            buffer,
+            errors,
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertFalse(result.timed_out)
+        self.assertEqual(buffer.getvalue().count(b"\n"), 5000)
+        self.assertEqual(errors.getvalue(), b"oops\n")
+
+    def test_concurrent(self):
+        threads = threading.active_count()
+        futures = [
+            PROCESSES.submit([sys.executable, "-c", CHATTY], OutputBuffer())
+            for _ in range(8)
+        ]
+        # Output is read by the event loop, not by threads per pipe
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertEqual([f.result().returncode for f in futures], [0] * 8)
+
+    def test_timeout(self):
+        started = time.monotonic()
+        result = PROCESSES.run(
+            [sys.executable, "-c", "import time; time.sleep(30)"],
+            OutputBuffer(),
+            timeout=0.5,
+        )
+        self.assertTrue(result.timed_out)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertLess(time.monotonic() - started, 10)
+
+        with self.assertRaises(subprocess.TimeoutExpired):
+            Executable(sys.executable)("-c", "import time; time.sleep(30)", timeout=0.5)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "requires /proc")
+    def test_timeout_process_tree(self):
+        output = OutputBuffer()
+        started = time.monotonic()
+        result = PROCESSES.run([sys.executable, "-c", SPAWNING], output, timeout=1)
+        self.assertTrue(result.timed_out)
+        self.assertLess(time.monotonic() - started, 10)
+
+        child = int(output.getvalue().split()[0])
+        deadline = time.monotonic() + 5
+        while running(child) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(running(child))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "requires /proc")
+    def test_cancel(self):
+        output = OutputBuffer()
+        future = PROCESSES.submit([sys.executable, "-c", SPAWNING_PIDS], output)
+        pids = [int(pid) for pid in waitOutput(output).split()]
+
+        future.cancel()
+        self.assertTrue(future.cancelled())
+        self.assertTrue(exited(*pids))
+
+    def test_failure_output(self):
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            Executable(sys.executable)("-c", "print('failed'); raise SystemExit(2)")
+        self.assertEqual(context.exception.output, b"failed\n")
+
+
+class TestOutputStream(unittest.TestCase):
+    def test_backpressure(self):
+        stream = OutputStream(limit=64 * 1024)
+        future = PROCESSES.submit(
+            [sys.executable, "-c", "import sys; sys.stdout.write('x' * 8000000)"],
+            stream,
+        )
+        future.add_done_callback(lambda _: stream.finish())
+
+        buffer = bytearray(1024)
+        size = stream.readinto(buffer)
+        time.sleep(0.5)
+        # Reading the pipe paused instead of holding the output
+        self.assertLess(stream._held, 1024 * 1024)
+
+        while True:
+            read = stream.readinto(buffer)
+            if not read:
+                break
+            size += read
+        self.assertEqual(size, 8000000)
+        self.assertEqual(future.result().returncode, 0)
+
+
+class TestExecutableLines(unittest.TestCase):
+    def test_lines(self):
+        lines = list(Executable(sys.executable).lines("-c", CHATTY))
+        self.assertEqual(len(lines), 5000)
+        self.assertEqual(lines[-1], "line 4999\n")
+
+    def test_failure(self):
+        errors = OutputBuffer()
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(
+                Executable(sys.executable).lines(
+                    "-c",
+                    "import sys; print('failed', file=sys.stderr); sys.exit(2)",
+                    stderr=errors,
+                )
+            )
+        self.assertEqual(errors.getvalue(), b"failed\n")
+
+    def test_timeout(self):
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            list(
+                Executable(sys.executable).lines(
+                    "-c", "import time; time.sleep(30)", timeout=0.5
+                )
+            )
+        self.assertLess(time.monotonic() - started, 10)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "requires /proc")
+    def test_stop_early(self):
+        lines = Executable(sys.executable).lines("-c", SPAWNING_PIDS)
+        pids = [int(pid) for pid in next(lines).split()]
+
+        lines.close()
+        self.assertTrue(exited(*pids))
+
+
+if __name__ == "__main__":
+    unittest.main()
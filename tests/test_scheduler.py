@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.scheduler import RAM_BASE, Allocation, Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def database(self, name: str, size: int) -> str:
+        path = os.path.join(self.temp.name, name)
+        os.makedirs(path)
+        # Sparse, only the size matters
+        with open(os.path.join(path, "data"), "wb") as handle:
+            handle.truncate(size)
+        return path
+
+    def test_request(self):
+        scheduler = Scheduler(4, threads=16, ram=32768)
+
+        # Small databases get an even share, large ones their estimate
+        small = self.database("small", 1024)
+        self.assertEqual(scheduler.request(small), Allocation(4, 8192))
+
+        large = self.database("large", 4096 * 1048576)
+        self.assertEqual(scheduler.request(large), Allocation(4, RAM_BASE + 8192))
+
+        # Never more than there is
+        huge = self.database("huge", 64 * 1024 * 1048576)
+        self.assertEqual(scheduler.request(huge), Allocation(4, 32768))
+
+    def test_threads(self):
+        self.assertEqual(Scheduler(3, threads=2, ram=1024).request(None).threads, 1)
+
+    def test_wait_for_ram(self):
+        scheduler = Scheduler(2, threads=4, ram=3000)
+        database = self.database("db", 1024)
+
+        allocated = threading.Event()
+
+        def second():
+            with scheduler.allocate(database):
+                allocated.set()
+
+        # Two evaluations need more memory than there is
+        with scheduler.allocate(database) as allocation:
+            self.assertEqual(allocation, Allocation(2, RAM_BASE))
+
+            thread = threading.Thread(target=second)
+            thread.start()
+            self.assertFalse(allocated.wait(timeout=0.2))
+
+        self.assertTrue(allocated.wait(timeout=5))
+        thread.join()
+        self.assertEqual(scheduler.ram_used, 0)
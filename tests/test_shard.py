@@ -0,0 +1,169 @@
+import os
+import sys
+import gzip
+import json
+import tempfile
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.merge import (
+    mergeBundle,
+    mergeExtensions,
+    mergeJson,
+    mergeJsonLines,
+)
+from codeqlsummarize.models import CodeQLDatabase
+from codeqlsummarize.shard import assignShards, parseShard, selectShard
+
+ROW = "com.example;Example;true;{name};;;Argument[0];ReturnValue;taint;generated"
+
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        self.databases = [
+            CodeQLDatabase(f"repo{i}", "java", repository=f"owner/repo{i}")
+            for i in range(20)
+        ]
+
+    def test_parse(self):
+        self.assertEqual(parseShard("2/4"), (2, 4))
+        with self.assertRaises(Exception):
+            parseShard("0/4")
+        with self.assertRaises(Exception):
+            parseShard("4")
+
+    def test_partition(self):
+        shards = [selectShard(self.databases, f"{i}/3") for i in range(1, 4)]
+        names = sorted(db.name for shard in shards for db in shard)
+        self.assertEqual(names, sorted(db.name for db in self.databases))
+
+    def test_stable(self):
+        shards = assignShards(self.databases, 4)
+        # A database keeps its shard when the list changes
+        reordered = assignShards(list(reversed(self.databases[5:])), 4)
+        self.assertEqual(list(reversed(reordered)), shards[5:])
+
+    def test_sizes(self):
+        sizes = {"owner/repo0": 100, "owner/repo1": 60, "owner/repo2": 50}
+        shards = assignShards(self.databases[:3], 2, sizes=sizes)
+        self.assertNotEqual(shards[0], shards[1])
+        self.assertEqual(shards[1], shards[2])
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def write(self, name: str, data: str) -> str:
+        path = os.path.join(self.temp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as handle:
+            handle.write(data)
+        return path
+
+    def test_json(self):
+        first = self.write("1.json", json.dumps({"summary": [ROW.format(name="b")]}))
+        second = self.write(
+            "2.json",
+            json.dumps(
+                {"summary": [ROW.format(name="a"), ROW.format(name="b")], "sinks": []}
+            ),
+        )
+        output = os.path.join(self.temp.name, "out.json")
+        mergeJson([first, second], output)
+
+        with open(output, "r") as handle:
+            merged = json.load(handle)
+        self.assertEqual(
+            merged, {"sinks": [], "summary": [ROW.format(name=n) for n in "ab"]}
+        )
+
+    def test_json_lines(self):
+        first = self.write("1.jsonl", '{"name": "a"}\n')
+        second = self.write("2.jsonl", '{"name": "b"}\n')
+        output = os.path.join(self.temp.name, "out.jsonl.gz")
+        mergeJsonLines([first, second], output)
+
+        with gzip.open(output, "rt") as handle:
+            self.assertEqual(handle.read(), '{"name": "a"}\n{"name": "b"}\n')
+
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.temp.name, name), "r") as handle:
+            return handle.read()
+
+    def test_extensions(self):
+        for shard in ["shard-1", "shard-2"]:
+            self.write(
+                f"{shard}/java/qlpack.yml",
+                "extensionTargets:\n  codeql/java-queries: '*'\n",
+            )
+            self.write(f"{shard}/java/README.md", "# Models\n")
+        self.write("shard-1/java/generated/repo1.yml", "repo1")
+        self.write("shard-2/java/generated/repo2.yml", "repo2")
+        output = os.path.join(self.temp.name, "out")
+        os.makedirs(output)
+
+        mergeExtensions(
+            [os.path.join(self.temp.name, s) for s in ["shard-1", "shard-2"]], output
+        )
+
+        # The pack is created from the first shard, with every shard's models
+        self.assertEqual(self.read("out/java/README.md"), "# Models\n")
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(output, "java", "generated"))),
+            ["repo1.yml", "repo2.yml"],
+        )
+        self.assertEqual(self.read("out/java/generated/repo1.yml"), "repo1")
+        self.assertEqual(self.read("out/java/generated/repo2.yml"), "repo2")
+
+    def test_extensions_root(self):
+        # Shards written with `-o ./shard-N`, the pack is the shard itself
+        for shard, name in [("shard-1", "repo1"), ("shard-2", "repo2")]:
+            self.write(
+                f"{shard}/qlpack.yml",
+                "extensionTargets:\n  codeql/java-queries: '*'\n",
+            )
+            self.write(f"{shard}/generated/{name}.yml", name)
+        output = os.path.join(self.temp.name, "out")
+        os.makedirs(output)
+
+        mergeExtensions(
+            [os.path.join(self.temp.name, s) for s in ["shard-1", "shard-2"]], output
+        )
+
+        self.assertIn("extensionTargets", self.read("out/qlpack.yml"))
+        self.assertEqual(self.read("out/generated/repo1.yml"), "repo1")
+        self.assertEqual(self.read("out/generated/repo2.yml"), "repo2")
+
+    def test_bundle(self):
+        library = "java-summarize/owner/java_summarize"
+        for shard, name in [("shard-1", "Repo1"), ("shard-2", "Repo2")]:
+            self.write(
+                f"{shard}/java-summarize/qlpack.yml", "name: owner/java-summarize\n"
+            )
+            self.write(f"{shard}/{library}/{name}.qll", f"// {name}\n")
+            self.write(
+                f"{shard}/{library}/Customizations.qll",
+                f"private import owner.java_summarize.{name}\n",
+            )
+        output = os.path.join(self.temp.name, "out")
+        os.makedirs(output)
+
+        mergeBundle(
+            [os.path.join(self.temp.name, s) for s in ["shard-1", "shard-2"]], output
+        )
+
+        self.assertEqual(self.read(f"out/{library}/Repo1.qll"), "// Repo1\n")
+        self.assertEqual(self.read(f"out/{library}/Repo2.qll"), "// Repo2\n")
+        # Regenerated to import the libraries of both shards
+        customizations = self.read(f"out/{library}/Customizations.qll")
+        self.assertIn("private import owner.java_summarize.Repo1\n", customizations)
+        self.assertIn("private import owner.java_summarize.Repo2\n", customizations)
+
+
+if __name__ == "__main__":
+    unittest.main()
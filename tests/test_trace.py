@@ -0,0 +1,62 @@
+import sys
+import json
+import unittest
+
+sys.path.append(".")
+
+from codeqlsummarize.trace import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    def test_spans(self):
+        tracer = Tracer()
+
+        with tracer.span("analyze", database="repo"):
+            with tracer.span("decode", query="q.ql"):
+                pass
+
+        with tracer.span("export"):
+            pass
+
+        self.assertEqual(
+            [s.name for s in tracer.spans], ["decode", "analyze", "export"]
+        )
+        analyze, decode = tracer.spans[1], tracer.spans[0]
+        self.assertLessEqual(analyze.start, decode.start)
+        self.assertGreaterEqual(analyze.duration, decode.duration)
+        self.assertEqual(analyze.args, {"database": "repo"})
+
+    def test_span_errors(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span("download"):
+                raise ValueError("failed")
+        self.assertEqual(len(tracer.spans), 1)
+
+    def test_chrome_trace(self):
+        tracer = Tracer()
+        with tracer.span("run-queries", "codeql"):
+            pass
+        tracer.count("result-cache.hit")
+        tracer.count("result-cache.hit")
+
+        trace = json.loads(json.dumps(tracer.chromeTrace()))
+        phases = [event["ph"] for event in trace["traceEvents"]]
+        self.assertEqual(phases, ["M", "X", "C", "C"])
+
+        complete = trace["traceEvents"][1]
+        self.assertEqual(complete["name"], "run-queries")
+        self.assertEqual(complete["cat"], "codeql")
+        self.assertEqual(trace["traceEvents"][-1]["args"], {"result-cache.hit": 2})
+
+    def test_summary(self):
+        tracer = Tracer()
+        for _ in range(3):
+            with tracer.span("decode"):
+                pass
+        tracer.count("result-cache.miss")
+
+        summary = tracer.summary()
+        self.assertTrue(summary[1].startswith("decode"))
+        self.assertIn(" 3 ", summary[1])
+        self.assertTrue(summary[2].startswith("result-cache.miss"))
@@ -0,0 +1,205 @@
+import gc
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+import warnings
+from subprocess import CalledProcessError
+
+sys.path.append(".")
+
+from codeqlsummarize import utils
+from codeqlsummarize.utils import (
+    RESOURCES,
+    CodeQLServer,
+    Executable,
+    findCodeQLCli,
+    loadMetadata,
+    saveMetadata,
+)
+
+# Stub CodeQL CLI of the benchmarks, which has `execute cli-server`
+STUB = os.path.abspath(os.path.join("benchmarks", "codeql"))
+
+
+class TestResourceProfiler(unittest.TestCase):
+    def setUp(self):
+        RESOURCES.usages.clear()
+
+    def test_record(self):
+        python = Executable(sys.executable)
+
+        with RESOURCES.label(database="owner/repo"):
+            with RESOURCES.label(query="Sink.ql"):
+                python("-c", "data = bytearray(64 * 1024 * 1024)")
+            list(python.lines("-c", "print('done')"))
+
+        first, second = RESOURCES.usages
+        self.assertEqual(first.labels, {"database": "owner/repo", "query": "Sink.ql"})
+        self.assertEqual(second.labels, {"database": "owner/repo"})
+        self.assertEqual(first.returncode, 0)
+        self.assertGreater(first.wall, 0)
+        if first.max_rss is not None:
+            self.assertGreaterEqual(first.max_rss, 64 * 1024 * 1024)
+
+        totals = RESOURCES.aggregate("database")[("owner/repo",)]
+        self.assertEqual(totals["invocations"], 2)
+
+        report = RESOURCES.report()
+        self.assertEqual(len(report["invocations"]), 2)
+        self.assertEqual(
+            [(q["database"], q["query"]) for q in report["queries"]],
+            [("owner/repo", "Sink.ql")],
+        )
+
+    def test_failure(self):
+        with self.assertRaises(Exception):
+            Executable(sys.executable)("-c", "raise SystemExit(3)")
+        self.assertEqual(RESOURCES.usages[-1].returncode, 3)
+
+
+class TestExecutable(unittest.TestCase):
+    def test_lines_closed(self):
+        python = Executable(sys.executable)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            lines = python.lines("-c", "for i in range(100000): print(i)")
+            # Stopping early closes the output
+            self.assertEqual(next(lines), "0\n")
+            lines.close()
+            del lines
+            gc.collect()
+
+        self.assertEqual([w for w in caught if w.category is ResourceWarning], [])
+
+
+class TestFindCodeQLCli(unittest.TestCase):
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.addCleanup(setattr, utils, "_codeql_cli", None)
+        self.addCleanup(setattr, utils, "CODEQL_CLI_CACHE", None)
+        self.addCleanup(
+            setattr, utils, "CODEQL_CLI_CACHE_TTL", utils.CODEQL_CLI_CACHE_TTL
+        )
+        self.addCleanup(os.environ.__setitem__, "PATH", os.environ["PATH"])
+
+        # A CodeQL CLI on the PATH and one left in the cache by another run
+        self.codeql = os.path.join(temp.name, "bin", "codeql")
+        self.cached = os.path.join(temp.name, "old", "codeql")
+        for path in [self.codeql, self.cached]:
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w") as handle:
+                handle.write("#!/bin/sh\n")
+            os.chmod(path, 0o755)
+        os.environ["PATH"] = os.path.dirname(self.codeql)
+
+        utils._codeql_cli = None
+        utils.CODEQL_CLI_CACHE = os.path.join(temp.name, "codeql-cli")
+        utils.CODEQL_CLI_CACHE_TTL = 60
+
+    def test_cached(self):
+        saved = time.time() - 30
+        saveMetadata(utils.CODEQL_CLI_CACHE, {"path": self.cached, "time": saved})
+
+        self.assertEqual(findCodeQLCli().executable, self.cached)
+        # Using the cache doesn't extend its time to live
+        self.assertEqual(loadMetadata(utils.CODEQL_CLI_CACHE)["time"], saved)
+
+    def test_expired(self):
+        saved = time.time() - 61
+        saveMetadata(utils.CODEQL_CLI_CACHE, {"path": self.cached, "time": saved})
+
+        self.assertEqual(findCodeQLCli().executable, self.codeql)
+        cache = loadMetadata(utils.CODEQL_CLI_CACHE)
+        self.assertEqual(cache["path"], self.codeql)
+        self.assertGreater(cache["time"], saved)
+
+
+class TestCodeQLServer(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.environ = dict(os.environ)
+        self.addCleanup(os.environ.update, self.environ)
+        self.addCleanup(os.environ.clear)
+
+        os.environ["CODEQL_BENCH_ROWS"] = "20"
+        self.bqrs = os.path.join(self.temp.name, "results.bqrs")
+        with open(self.bqrs, "w") as handle:
+            json.dump({"rows": 20, "model": "SinkModel", "seed": 1}, handle)
+
+    def server(self) -> CodeQLServer:
+        server = CodeQLServer(Executable(STUB))
+        self.addCleanup(server.shutdown)
+        return server
+
+    def decode(self, codeql) -> list:
+        return list(codeql.lines("bqrs", "decode", "--format", "csv", self.bqrs))
+
+    def test_protocol(self):
+        server = self.server()
+
+        output = io.BytesIO()
+        server("version", "--format", "json", stdout=output)
+        self.assertTrue(json.loads(output.getvalue())["version"])
+        rows = self.decode(server)
+
+        self.assertEqual(rows, self.decode(Executable(STUB)))
+        self.assertEqual(len(rows), 20)
+        # Both commands ran on the same server process
+        (process,) = server._processes
+        self.assertEqual(process.commands, 2)
+
+    def test_stderr(self):
+        os.environ["CODEQL_BENCH_LOG"] = "3"
+        server = self.server()
+        database = os.path.join(self.temp.name, "db")
+
+        output, errors = io.BytesIO(), io.BytesIO()
+        server(
+            "database",
+            "run-queries",
+            database,
+            "CaptureSinkModels.ql",
+            stdout=output,
+            stderr=errors,
+            combine_std_out_err=False,
+        )
+        self.assertEqual(output.getvalue(), b"Ran 1 queries\n")
+        self.assertEqual(errors.getvalue().count(b"Evaluating predicate"), 3)
+
+        # Logged by the previous command only
+        errors = io.BytesIO()
+        self.decode(server)
+        list(server.lines("version", stderr=errors))
+        self.assertEqual(errors.getvalue(), b"")
+
+    def test_unsupported(self):
+        os.environ["CODEQL_BENCH_SERVER"] = "0"
+        server = self.server()
+
+        self.assertFalse(server.supported())
+        self.assertEqual(len(self.decode(server)), 20)
+        self.assertEqual(server._processes, [])
+
+    def test_crash(self):
+        os.environ["CODEQL_BENCH_SERVER_CRASH"] = "5"
+        server = self.server()
+
+        rows = []
+        with self.assertRaises(CalledProcessError):
+            for row in server.lines("bqrs", "decode", "--format", "csv", self.bqrs):
+                rows.append(row)
+        self.assertEqual(len(rows), 5)
+
+        # Only the command failed, the next one starts a new server
+        self.assertTrue(server.supported())
+        output = io.BytesIO()
+        server("version", stdout=output)
+        self.assertIn(b"version", output.getvalue())
+        self.assertEqual(len(server._processes), 2)